@@ -1,29 +1,1033 @@
-from flask import Flask, request, jsonify
+import atexit
+import hashlib
+import hmac
+import io
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.wsgi import ClosingIterator
+import together
 from together import Together
 
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip/deflate are offered
+    brotli = None
+
+# --- Configuration ---
+TOGETHER_API_KEY = os.environ.get("TOGETHER_API_KEY", "")
+if not TOGETHER_API_KEY:
+    raise RuntimeError("TOGETHER_API_KEY is not set; export your Together API key before starting the server")
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "20"))  # Max open connections to Together per process
+UPSTREAM_KEEPALIVE = int(os.environ.get("UPSTREAM_KEEPALIVE", "10"))  # Idle keep-alive connections kept in the pool
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_FIRST_TOKEN_TIMEOUT = float(os.environ.get("UPSTREAM_FIRST_TOKEN_TIMEOUT", "45"))  # Request sent -> first chunk
+UPSTREAM_IDLE_TIMEOUT = float(os.environ.get("UPSTREAM_IDLE_TIMEOUT", "30"))  # Longest gap allowed between chunks
+UPSTREAM_READ_TIMEOUT = max(UPSTREAM_FIRST_TOKEN_TIMEOUT, UPSTREAM_IDLE_TIMEOUT)  # Client-wide socket backstop
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "2"))  # Per model, before any output was sent
+UPSTREAM_BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX", "8"))
+UPSTREAM_FALLBACK_MODELS = [model.strip() for model in os.environ.get(
+    "UPSTREAM_FALLBACK_MODELS", "").split(",") if model.strip()]  # Tried in order once the primary gives up
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures to open
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))  # Seconds open before a trial call
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") == "1"  # Share one upstream call among identical requests
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "16"))  # Generations allowed upstream at once
+UPSTREAM_QUEUE_LIMIT = int(os.environ.get("UPSTREAM_QUEUE_LIMIT", "64"))  # Requests allowed to wait for a slot
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))  # Seconds a request may wait
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "30"))  # Per client; 0 disables rate limiting
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_API_KEYS = {key.strip() for key in os.environ.get(
+    "API_KEYS", "").split(",") if key.strip()}  # X-API-Key values that get a bucket of their own
+PROMPT_REDUCTION = [stage.strip() for stage in os.environ.get(
+    "PROMPT_REDUCTION", "vendored,comments,whitespace,budget").split(",") if stage.strip()]
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "24000"))  # Estimated input tokens for the sources
+VENDORED_LIBRARY_FILES = [path.strip() for path in os.environ.get(
+    "VENDORED_LIBRARY_FILES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "all.min.js")).split(",")
+    if path.strip()]
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", "8"))  # Items of one batch generated at once
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "3600"))  # Seconds a cached generation stays valid
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "")  # SQLite file for a restart-surviving tier; empty disables it
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "0") == "1"  # Warm the cache in the background
+PREFETCH_PAYLOADS_FILE = os.environ.get("PREFETCH_PAYLOADS_FILE", "")  # JSON list of payloads to keep warm
+PREFETCH_TOP_N = int(os.environ.get("PREFETCH_TOP_N", "10"))  # Also warm the N most frequent recent payloads
+PREFETCH_TRACK_ENTRIES = int(os.environ.get("PREFETCH_TRACK_ENTRIES", "500"))  # Recent payloads counted
+PREFETCH_ADMIN_KEY = os.environ.get("PREFETCH_ADMIN_KEY", "")  # X-Admin-Key for POST /prefetch; empty: localhost only
+PREFETCH_INTERVAL = float(os.environ.get("PREFETCH_INTERVAL", "900"))  # Seconds between runs; 0 runs once
+PREFETCH_BUDGET = int(os.environ.get("PREFETCH_BUDGET", "50"))  # Upstream generations allowed per window
+PREFETCH_BUDGET_WINDOW = float(os.environ.get("PREFETCH_BUDGET_WINDOW", "86400"))
+
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", str(4 * 1024 * 1024)))  # Decoded body size limit
+COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))  # Smaller JSON bodies go out as is
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))
+
+MODEL_PARAMS = {
+    "model": "deepseek-ai/DeepSeek-V3",
+    "max_tokens": 5576,
+    "temperature": 0.7,
+    "top_p": 0.7,
+    "top_k": 50,
+    "repetition_penalty": 1,
+    "stop": ["<｜end▁of▁sentence｜>"],
+}
+
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES  # Refused from Content-Length, before reading the body
 CORS(app)  # Enable CORS for all routes
 app.logger.info("Server started")
 
-@app.route('/generate-code', methods=['POST'])
-def generate_code():
-    app.logger.info("Received request to /generate-code")
 
-    # Get the request data
-    data = request.json
-    print(data)
-    app.logger.info(f"Request data: {data}")
-
-    language = data.get('language', 'js')
-    html_code = data.get('htmlCode', '')
-    css_code = data.get('cssCode', '')
-    js_code = data.get('jsCode', '')
-    user_prompt = data.get('prompt', 'Enhance this code with best practices and optimizations')
-    
-    # Initialize the Together API client
-    client = Together(api_key="07589fb47c69da2f5af8b4ecdee9b843614c5f76605e1706b1af22ea1dd728cd")
-    
+# --- Shared Together client ---
+# One client per worker process so keep-alive connections (and their TLS sessions)
+# are reused across requests instead of being rebuilt on every POST.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_together_client():
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            # Re-check under the lock; also rebuild after a fork so children never
+            # share the parent's sockets.
+            if _client is None or _client_pid != pid:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=UPSTREAM_POOL_SIZE,
+                                        max_keepalive_connections=UPSTREAM_KEEPALIVE),
+                    timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+                )
+                # Retries are handled by the resilience layer below, not the SDK
+                _client = Together(api_key=TOGETHER_API_KEY, http_client=http_client, max_retries=0)
+                _client_pid = pid
+                app.logger.info(f"Created Together client (pool size {UPSTREAM_POOL_SIZE})")
+    return _client
+
+
+@atexit.register
+def close_together_client():
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+# --- Metrics ---
+# A small Prometheus-style registry; GET /metrics renders it in the text exposition format.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000, 5000000)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is read from a callback when metrics are scraped."""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.read()}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+phase_seconds = metrics.register(Histogram(
+    "generate_code_phase_seconds",
+    "Time spent in each phase of a generation (parse, prompt_build, upstream_connect, "
+    "time_to_first_token, stream, extraction)", labelnames=("phase",)))
+request_seconds = metrics.register(Histogram(
+    "http_request_duration_seconds", "Time to produce a response (streams: until headers are sent)",
+    labelnames=("endpoint",)))
+requests_total = metrics.register(Counter(
+    "http_requests_total", "HTTP requests by endpoint and status", labelnames=("endpoint", "status")))
+request_bytes = metrics.register(Histogram(
+    "http_request_bytes", "Request body sizes", buckets=SIZE_BUCKETS, labelnames=("endpoint",)))
+prompt_tokens = metrics.register(Histogram(
+    "generate_code_prompt_tokens", "Estimated source tokens before and after prompt reduction",
+    buckets=(100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000), labelnames=("stage",)))
+output_chunks = metrics.register(Counter(
+    "generate_code_output_chunks_total", "Streamed upstream chunks (roughly output tokens)"))
+output_bytes = metrics.register(Counter(
+    "generate_code_output_bytes_total", "Bytes of model output received from upstream"))
+generations_total = metrics.register(Counter(
+    "generate_code_generations_total", "Upstream generations by outcome", labelnames=("outcome",)))
+coalesced_total = metrics.register(Counter(
+    "generate_code_coalesced_total", "Requests that attached to another request's generation"))
+rejected_total = metrics.register(Counter(
+    "generate_code_rejected_total", "Requests turned away by admission control", labelnames=("status",)))
+patch_total = metrics.register(Counter(
+    "generate_code_patch_total", "Edit-mode responses by outcome (applied or fallback)", labelnames=("outcome",)))
+upstream_attempts = metrics.register(Counter(
+    "generate_code_upstream_attempts_total", "Upstream calls by model and outcome (ok or error type)",
+    labelnames=("model", "outcome")))
+
+
+class UpstreamTimings:
+    """Per-phase timings of one upstream generation, recorded into the metrics when it ends."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connected = None
+        self.first_token = None
+        self.extraction = 0.0
+        self.chunks = 0
+        self.output_bytes = 0
+
+    def mark_connected(self):
+        self.connected = time.perf_counter()
+
+    def add_chunk(self, content):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+        self.output_bytes += len(content.encode('utf-8'))
+
+    def record(self, outcome):
+        finished = time.perf_counter()
+        timings = {}
+        if self.connected is not None:
+            timings['upstream_connect'] = self.connected - self.started
+            timings['stream'] = finished - self.connected
+        if self.first_token is not None:
+            timings['time_to_first_token'] = self.first_token - self.started
+        timings['extraction'] = self.extraction
+        for phase, seconds in timings.items():
+            phase_seconds.observe(seconds, phase=phase)
+        output_chunks.inc(self.chunks)
+        output_bytes.inc(self.output_bytes)
+        generations_total.inc(outcome=outcome)
+        app.logger.info("Generation %s: %s chunks=%d output_bytes=%d", outcome,
+                        " ".join(f"{phase}={seconds:.3f}s" for phase, seconds in timings.items()),
+                        self.chunks, self.output_bytes)
+
+
+# --- Admission control ---
+class Rejected(Exception):
+    """A request turned away before reaching Together; rendered as a fast 429/503."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket per client key (API key or IP address)."""
+
+    def __init__(self, per_minute, burst, max_clients=10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, count=1):
+        """Take up to `count` tokens for `key`.
+
+        Returns how many were granted and, when that is short of `count`, the seconds
+        until the next token is available (otherwise 0).
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            granted = min(count, int(tokens))
+            tokens -= granted
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return granted, 0 if granted == count else (1 - tokens) / self.rate
+
+    def check(self, key):
+        """Take a token for `key`, raising Rejected(429) when its bucket is empty."""
+        granted, retry_after = self.take(key)
+        if not granted:
+            raise Rejected(429, "Rate limit exceeded", retry_after)
+
+
+class AdmissionGate:
+    """Caps concurrent upstream generations, with a bounded queue of waiters."""
+
+    def __init__(self, limit, queue_limit, timeout):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take an upstream slot or raise Rejected(503) if the queue is full or the wait times out."""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return
+            if self.waiting >= self.queue_limit:
+                raise Rejected(503, "Server busy, upstream queue is full", self.timeout)
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.active < self.limit, timeout=self.timeout):
+                    raise Rejected(503, "Server busy, timed out waiting for an upstream slot", self.timeout)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+upstream_gate = AdmissionGate(UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE_LIMIT, UPSTREAM_QUEUE_TIMEOUT)
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST) if RATE_LIMIT_PER_MINUTE > 0 else None
+
+
+def client_key(api_key, remote_addr):
+    """Rate-limit by API key when the caller sends a known one (API_KEYS), otherwise by IP address.
+
+    Unknown keys are ignored: anyone can make one up, and a fresh key per request
+    would otherwise mean a fresh bucket per request.
+    """
+    return f"key:{api_key}" if api_key in RATE_LIMIT_API_KEYS else f"ip:{remote_addr}"
+
+
+def take_item_tokens(key, count):
+    """Charge each of `count` items (batch entries, fan-out languages) one token from `key`'s bucket.
+
+    Returns (allowed, rejection): the first `allowed` items may run and the rest are
+    reported with `rejection`, a Rejected(429). Raises it instead when no item may run.
+    """
+    if not rate_limiter:
+        return count, None
+    allowed, retry_after = rate_limiter.take(key, count)
+    if allowed == count:
+        return count, None
+    rejection = Rejected(429, f"Rate limit exceeded ({allowed} of {count} items allowed)", retry_after)
+    if not allowed:
+        raise rejection
+    rejected_total.inc(count - allowed, status=429)
+    return allowed, rejection
+
+
+@app.errorhandler(Rejected)
+def handle_rejected(e):
+    if e.status == 429:
+        rejected_total.inc(status=e.status)
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return response
+
+
+# --- Compression and request size limits ---
+# Request bodies may arrive gzip/deflate encoded; they are decoded before Flask sees
+# them, and both the encoded and the decoded size count against MAX_REQUEST_BYTES.
+# (Not br: the brotli package cannot cap how much one call inflates, so a small
+# bomb would be expanded in full before the size check.) Responses are compressed
+# per Accept-Encoding (br included), streams too: every event is flushed through
+# the compressor as it is written.
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/event-stream', 'application/x-ndjson', 'text/plain')
+
+
+class PayloadError(Exception):
+    """A request body that is too large or can't be decoded; rendered as a 413/415/400."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+REQUEST_ENCODINGS = ('gzip', 'deflate')
+
+
+def supported_encodings():
+    """Response encodings, in order of preference."""
+    return ('br', 'gzip', 'deflate') if brotli else ('gzip', 'deflate')
+
+
+def decode_body(body, encoding, limit):
+    """Decompress a request body, refusing to inflate it past `limit` bytes."""
+    encoding = encoding.strip().lower()
+    if encoding in ('', 'identity'):
+        return body
+    try:
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            # wbits 47 auto-detects gzip and zlib headers; raw deflate is retried below
+            decoder = zlib.decompressobj(47)
+            try:
+                decoded = decoder.decompress(body, limit + 1)
+            except zlib.error:
+                if encoding != 'deflate':
+                    raise
+                decoded = zlib.decompressobj(-zlib.MAX_WBITS).decompress(body, limit + 1)
+        else:
+            raise PayloadError(415, f"Unsupported Content-Encoding {encoding!r}; "
+                                    f"use one of {', '.join(REQUEST_ENCODINGS)}")
+    except zlib.error as e:
+        raise PayloadError(400, f"Request body is not valid {encoding}: {e}")
+    if len(decoded) > limit:
+        raise PayloadError(413, f"Decoded request body exceeds {limit} bytes")
+    return decoded
+
+
+def pick_encoding(accept_encoding):
+    """Choose a response encoding from an Accept-Encoding header, or None."""
+    offered = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    for encoding in supported_encodings():
+        if offered.get(encoding, offered.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+class StreamCompressor:
+    """Incremental gzip/deflate/br encoder whose output can be flushed per event."""
+
+    def __init__(self, encoding, level=COMPRESS_LEVEL):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._encoder = brotli.Compressor(quality=min(level, 11))
+        else:
+            self._encoder = zlib.compressobj(level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+
+    def compress(self, data, flush=True):
+        if self.encoding == 'br':
+            out = self._encoder.process(data)
+            return out + self._encoder.flush() if flush else out
+        out = self._encoder.compress(data)
+        return out + self._encoder.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        return self._encoder.finish() if self.encoding == 'br' else self._encoder.flush()
+
+
+def compress_stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
+
+
+def payload_error_response(status, message):
+    body = json.dumps({"error": message}).encode('utf-8')
+    return Response(body, status=status, mimetype='application/json')
+
+
+class DecompressionMiddleware:
+    """WSGI middleware that decodes Content-Encoding request bodies before Flask reads them."""
+
+    def __init__(self, wsgi_app, limit):
+        self.wsgi_app = wsgi_app
+        self.limit = limit
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '')
+        if encoding.strip().lower() in ('', 'identity'):
+            return self.wsgi_app(environ, start_response)
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > self.limit:
+            return payload_error_response(413, f"Request body exceeds {self.limit} bytes")(environ, start_response)
+        stream = environ['wsgi.input']
+        if length:
+            body = stream.read(length)
+        elif environ.get('wsgi.input_terminated'):
+            body = stream.read(self.limit + 1)  # Chunked upload: read at most one byte past the limit
+            if len(body) > self.limit:
+                return payload_error_response(413, f"Request body exceeds {self.limit} bytes")(
+                    environ, start_response)
+        else:
+            body = b''
+        try:
+            body = decode_body(body, encoding, self.limit)
+        except PayloadError as e:
+            return payload_error_response(e.status, str(e))(environ, start_response)
+        environ['app.encoded_bytes'] = length or None
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        environ.pop('wsgi.input_terminated', None)
+        return self.wsgi_app(environ, start_response)
+
+
+app.wsgi_app = DecompressionMiddleware(app.wsgi_app, MAX_REQUEST_BYTES)
+
+
+@app.errorhandler(413)
+def handle_too_large(e):
+    return jsonify({"error": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"}), 413
+
+
+@app.errorhandler(PayloadError)
+def handle_payload_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+
+# --- Upstream resilience ---
+class UpstreamTimeout(Exception):
+    """The upstream stream missed its first-token or idle deadline."""
+
+
+class UpstreamUnavailable(Exception):
+    """Every model/attempt failed; rendered as a 502 (or 503 when all circuits are open)."""
+
+    def __init__(self, message, status=502, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after a cooldown."""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                app.logger.info(f"Circuit for {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    app.logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_rejection(self):
+        """The call failed through no fault of the model (e.g. a 400): free the trial slot, keep the state."""
+        with self._lock:
+            self._trial_running = False
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+circuit_breakers = {
+    model: CircuitBreaker(model, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+    for model in [MODEL_PARAMS["model"]] + UPSTREAM_FALLBACK_MODELS
+}
+
+
+def is_retryable(error):
+    if isinstance(error, (UpstreamTimeout, together.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, together.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    # Error events inside an otherwise successful stream carry no status code
+    return isinstance(error, together.APIError)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class StreamWatchdog:
+    """One background thread enforcing first-token and idle deadlines on open upstream streams.
+
+    A stream that misses its deadline is closed from here, which makes the
+    worker's blocking read fail; the worker then sees `watch.expired`.
+    """
+
+    class Watch:
+        def __init__(self, close, deadline):
+            self.close = close
+            self.deadline = deadline
+            self.expired = None
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._watches = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, close, timeout):
+        watch = self.Watch(close, time.monotonic() + timeout)
+        with self._lock:
+            self._watches.add(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-watchdog", daemon=True)
+                self._thread.start()
+        return watch
+
+    def unwatch(self, watch):
+        with self._lock:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                expired = [watch for watch in self._watches if now > watch.deadline]
+                self._watches.difference_update(expired)
+            for watch in expired:
+                watch.expired = True
+                try:
+                    watch.close()
+                except Exception:
+                    app.logger.exception("Closing a stalled upstream stream failed")
+
+
+stream_watchdog = StreamWatchdog()
+
+
+def stream_once(model, messages, timings):
+    """Yield deltas from one upstream call, raising UpstreamTimeout if it stalls."""
+    deadline = time.monotonic() + UPSTREAM_FIRST_TOKEN_TIMEOUT
+    try:
+        # The socket read timeout bounds the wait for response headers; the watchdog takes over after
+        response = get_together_client().chat.completions.create(
+            messages=messages,
+            stream=True,
+            timeout=httpx.Timeout(UPSTREAM_FIRST_TOKEN_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            **dict(MODEL_PARAMS, model=model)
+        )
+    except together.APITimeoutError as e:
+        raise UpstreamTimeout(f"{model} did not respond in time") from e
+    timings.mark_connected()
+    watch = stream_watchdog.watch(response.close, max(0.0, deadline - time.monotonic()))
+    phase = "first token"
+    try:
+        for content in iter_deltas(response):
+            phase = "idle"
+            watch.deadline = time.monotonic() + UPSTREAM_IDLE_TIMEOUT
+            yield content
+    except Exception as e:
+        if watch.expired:
+            raise UpstreamTimeout(f"{model} missed its {phase} deadline") from e
+        raise
+    finally:
+        stream_watchdog.unwatch(watch)
+    if watch.expired:
+        raise UpstreamTimeout(f"{model} missed its {phase} deadline")
+
+
+class UpstreamAttempts:
+    """The retry and fallback policy behind resilient_stream, without its I/O (the ASGI app shares it).
+
+    Iterating yields the (model, breaker) to try next. Report how each try went with
+    succeeded() or failed(); failed() raises when the failure is final and otherwise
+    returns how long to back off. Once the iteration runs out, raise exhausted().
+
+    A try that fails after producing output can only be repeated if `restart()`
+    discards that output, which it refuses once a client has received some.
+    """
+
+    def __init__(self, restart=None):
+        self.restart = restart
+        self.last_error = None
+        self._attempt = 0
+        self._next_model = False
+
+    def __iter__(self):
+        for model, breaker in circuit_breakers.items():
+            for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+                if not breaker.allow():
+                    app.logger.info(f"Skipping {model}: circuit {breaker.state}")
+                    break
+                self._attempt, self._next_model = attempt, False
+                yield model, breaker
+                if self._next_model:
+                    break
+
+    def succeeded(self, model, breaker):
+        breaker.record_success()
+        upstream_attempts.inc(model=model, outcome="ok")
+
+    def failed(self, model, breaker, error, produced):
+        self.last_error = error
+        upstream_attempts.inc(model=model, outcome=type(error).__name__)
+        # Only failures on the upstream's side count against its circuit; a request
+        # it rejects (too long, malformed) would be rejected by any healthy model too
+        if is_retryable(error):
+            breaker.record_failure()
+        else:
+            breaker.record_rejection()
+        if produced:
+            if not (self.restart and self.restart()):
+                raise UpstreamUnavailable(f"Upstream failed mid-response: {error}") from error
+            app.logger.warning(f"Discarding unread partial output from {model}")
+        if not is_retryable(error):
+            raise UpstreamUnavailable(f"Upstream rejected the request: {error}") from error
+        if isinstance(error, UpstreamTimeout) or self._attempt == UPSTREAM_MAX_RETRIES:
+            app.logger.warning(f"Giving up on {model}: {error}")
+            self._next_model = True
+            return 0
+        delay = backoff_delay(self._attempt)
+        app.logger.warning(f"Retrying {model} in {delay:.2f}s after: {error}")
+        return delay
+
+    def exhausted(self):
+        if all(breaker.state == "open" for breaker in circuit_breakers.values()):
+            retry_after = min(breaker.retry_after() for breaker in circuit_breakers.values())
+            return UpstreamUnavailable("Upstream unavailable (all circuits open)", 503, retry_after)
+        return UpstreamUnavailable(f"Upstream failed: {self.last_error}")
+
+
+def resilient_stream(messages, timings, restart=None):
+    """Yield deltas from the first model that works, retrying and falling back as needed.
+
+    Once deltas have been yielded, a failure can only be retried if `restart()` takes
+    them back (see UpstreamAttempts); otherwise it ends the stream with a 502. A
+    first-token timeout moves on to the next model straight away instead of
+    retrying the slow one.
+    """
+    attempts = UpstreamAttempts(restart)
+    for model, breaker in attempts:
+        produced = False
+        try:
+            for content in stream_once(model, messages, timings):
+                produced = True
+                yield content
+            attempts.succeeded(model, breaker)
+            return
+        except Exception as e:
+            delay = attempts.failed(model, breaker, e, produced)
+            if delay:
+                time.sleep(delay)
+    raise attempts.exhausted() from attempts.last_error
+
+
+@app.errorhandler(UpstreamUnavailable)
+def handle_upstream_unavailable(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return response
+
+
+# --- Response cache ---
+class ResponseCache:
+    """Bounded in-memory LRU with TTL, optionally backed by a SQLite tier that survives restarts."""
+
+    def __init__(self, max_entries, ttl, db_path=""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS generations "
+                             "(key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)")
+            self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT stored_at, value FROM generations WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[0] <= self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[1]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO generations (key, stored_at, value) VALUES (?, ?, ?)",
+                                 (key, now, value))
+                self._db.execute("DELETE FROM generations WHERE stored_at < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def _remember(self, key, stored_at, value):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def contains(self, key):
+        """Whether `key` has a fresh entry, without touching LRU order or hit/miss counts."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                return True
+            if self._db is not None:
+                row = self._db.execute("SELECT stored_at FROM generations WHERE key = ?", (key,)).fetchone()
+                return row is not None and now - row[0] <= self.ttl
+            return False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttl": self.ttl,
+                "diskTier": self._db is not None,
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB_PATH) if CACHE_ENABLED else None
+
+
+def cache_key(language, html_code, css_code, js_code, user_prompt, mode='full'):
+    """Hash the normalized payload together with the model parameters that shape the output."""
+    def normalize(text):
+        return text.replace('\r\n', '\n').strip()
+
+    fields = {
+        "language": language.strip().lower(),
+        "htmlCode": normalize(html_code),
+        "cssCode": normalize(css_code),
+        "jsCode": normalize(js_code),
+        "prompt": normalize(user_prompt),
+        "params": MODEL_PARAMS,
+    }
+    if mode != 'full':
+        # "edits" and "patch" share one upstream response; full-mode keys stay unchanged
+        fields["mode"] = "edits"
+    material = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+# --- Request coalescing (single-flight) ---
+class Flight:
+    """One upstream generation that any number of identical requests can attach to.
+
+    Code deltas are kept so a request that joins late still replays the stream
+    from the start before following it live.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.deltas = []
+        self.delivered = False  # Whether any streaming request has been handed a delta
+        self.done = False
+        self.result = None
+        self.error = None
+        self._cond = threading.Condition()
+
+    def publish(self, content):
+        with self._cond:
+            self.deltas.append(content)
+            self._cond.notify_all()
+
+    def restart(self):
+        """Drop the deltas so far for a retried upstream call; refused once any were delivered."""
+        with self._cond:
+            if self.delivered:
+                return False
+            self.deltas = []
+            return True
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def iter_deltas(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.deltas) and not self.done:
+                    self._cond.wait()
+                pending = self.deltas[index:]
+                finished = self.done
+                self.delivered = self.delivered or bool(pending)
+            index += len(pending)
+            yield from pending
+            if finished and index >= len(self.deltas):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    def wait(self):
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Maps payload hashes to the generation currently in progress for them."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Return (flight, is_leader); the leader is responsible for running the generation."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = Flight(key)
+            self._flights[key] = flight
+            return flight, True
+
+    def forget(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+in_flight_generations = SingleFlight()
+generation_executor = ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY, thread_name_prefix="generation")
+
+
+def build_messages(language, html_code, css_code, js_code, user_prompt):
     # Create the prompt based on the language
     system_prompt = "You are a helpful coding assistant that provides enhanced code."
     
@@ -39,77 +1043,1348 @@ User instructions: {user_prompt}
 Please improve the {language.upper()} code specifically.
 Only return the improved code without explanations or markdown formatting.
 """
-    
-    # Call the Together API
-    response = client.chat.completions.create(
-        model="deepseek-ai/DeepSeek-V3",
-        messages=[
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user", 
-                "content": prompt_content
-            }
-        ],
-        max_tokens=5576,
-        temperature=0.7,
-        top_p=0.7,
-        top_k=50,
-        repetition_penalty=1,
-        stop=["<｜end▁of▁sentence｜>"],
-        stream=True
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user", 
+            "content": prompt_content
+        }
+    ]
+
+
+# --- Prompt size reduction ---
+# Runs over htmlCode/cssCode/jsCode before they are put into the prompt. The stages
+# are listed in PROMPT_REDUCTION and run in this order: vendored (before anything
+# rewrites the text, so hashes still match), comments, whitespace, budget.
+# Like minifiers, /*! ... */ comments are kept; elision placeholders rely on that.
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|/\*(?!!).*?\*/', re.S)
+_JS_TOKENS = re.compile(
+    r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`'  # strings and template literals
+    r'|(?:(?<=[(,=:\[!&|?{};])|(?<=\breturn)|(?<=\btypeof)|^)[ \t]*'  # regex literals, where one can start
+    r'/(?![*/])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*)'
+    r'|/\*(?!!).*?\*/'                                                         # block comments
+    r'|(?:^|(?<=[\s;{}(),=]))//[^\n]*',                                       # line comments
+    re.S | re.M)
+_HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+_INLINE_BLOCK = re.compile(r'(<(script|style)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+
+LIBRARY_SIGNATURES = [
+    ("jQuery", re.compile(r'jQuery (?:JavaScript Library )?v\d')),
+    ("Font Awesome", re.compile(r'Font Awesome')),
+    ("nerdamer", re.compile(r'var nerdamer\s*=\s*function')),
+    ("math.js", re.compile(r'\bmath\.js\b')),
+    ("Bootstrap", re.compile(r'Bootstrap v\d')),
+    ("lodash", re.compile(r'@license\s+Lodash|lodash\.com')),
+    ("Chart.js", re.compile(r'Chart\.js v\d')),
+    ("D3", re.compile(r'https://d3js\.org v\d')),
+]
+VENDORED_MIN_SIZE = 20000  # Banner detection only applies to sources at least this large
+
+_known_library_hashes = None
+
+
+def _source_hash(code):
+    return hashlib.sha256(code.replace('\r\n', '\n').strip().encode('utf-8')).hexdigest()
+
+
+def known_library_hashes():
+    """Hashes of the files in VENDORED_LIBRARY_FILES, computed once."""
+    global _known_library_hashes
+    if _known_library_hashes is None:
+        hashes = {}
+        for path in VENDORED_LIBRARY_FILES:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    hashes[_source_hash(f.read())] = os.path.basename(path)
+            except (IOError, UnicodeDecodeError) as e:
+                app.logger.warning(f"Could not hash vendored library {path}: {e}")
+        _known_library_hashes = hashes
+    return _known_library_hashes
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for code; good enough for budgeting.
+    return (len(text) + 3) // 4
+
+
+def strip_comments(code, kind):
+    if kind == 'html':
+        code = _HTML_COMMENT.sub('', code)
+        return _INLINE_BLOCK.sub(
+            lambda m: m.group(1) + strip_comments(m.group(3), 'js' if m.group(2).lower() == 'script' else 'css')
+            + m.group(4), code)
+    pattern = _JS_TOKENS if kind == 'js' else _CSS_TOKENS
+    return pattern.sub(lambda m: m.group(1) or '', code)
+
+
+def collapse_whitespace(code):
+    """Drop indentation, trailing whitespace and blank lines."""
+    return '\n'.join(line.strip() for line in code.splitlines() if line.strip())
+
+
+def identify_library(code):
+    """Return the name of a well-known vendored library `code` is, or None."""
+    name = known_library_hashes().get(_source_hash(code))
+    if name or len(code) < VENDORED_MIN_SIZE:
+        return name
+    head = code[:500]
+    for library, signature in LIBRARY_SIGNATURES:
+        if signature.search(head):
+            return library
+    return None
+
+
+def elide_vendored(code, kind, elided):
+    def placeholder(name):
+        return f"/*! [vendored library elided: {name}] keep this placeholder unchanged */"
+
+    if kind == 'html':
+        def replace_block(m):
+            name = identify_library(m.group(3)) if m.group(2).lower() == 'script' else None
+            if not name:
+                return m.group(0)
+            elided.append(name)
+            return m.group(1) + placeholder(name) + m.group(4)
+        return _INLINE_BLOCK.sub(replace_block, code)
+    name = identify_library(code)
+    if not name:
+        return code
+    elided.append(name)
+    return placeholder(name)
+
+
+_OMISSION_MARKERS = {'html': "<!-- {} -->", 'css': "/* {} */", 'js': "/* {} */"}
+
+
+def truncate_middle(code, max_chars, kind):
+    """Keep the head and tail of `code` on line boundaries, marking what was cut in `kind`'s comment syntax."""
+    if len(code) <= max_chars:
+        return code
+    head_end = code.rfind('\n', 0, max_chars * 2 // 3)
+    head_end = head_end if head_end > 0 else max_chars * 2 // 3
+    tail_start = code.find('\n', len(code) - max_chars // 3)
+    tail_start = tail_start + 1 if tail_start != -1 else len(code) - max_chars // 3
+    omitted = code.count('\n', head_end, tail_start)
+    marker = _OMISSION_MARKERS[kind].format(f"... {omitted} lines omitted to fit the prompt budget ...")
+    return f"{code[:head_end]}\n{marker}\n{code[tail_start:]}"
+
+
+def fit_budget(sources, language, budget):
+    """Truncate sources so their estimated tokens fit `budget`; returns (sources, truncated kinds).
+
+    Only the other sources are cut, to nothing if need be. The one being improved
+    is never trimmed, since the model has to hand it back whole (or quote it
+    exactly); when it does not fit on its own, the request is refused with a 413.
+    """
+    total = sum(estimate_tokens(code) for code in sources.values())
+    if total <= budget:
+        return sources, []
+    target = source_kind(language)
+    target_tokens = estimate_tokens(sources.get(target, ''))
+    if target_tokens > budget:
+        raise PayloadError(413, f"The {target} source is ~{target_tokens} tokens, over the prompt budget "
+                                f"of {budget}; send a smaller file or split it up")
+    fitted = dict(sources)
+    truncated = []
+    others = [kind for kind in sources if kind != target and sources[kind]]
+    # The other sources share whatever the target leaves over
+    other_budget = budget - target_tokens
+    other_total = sum(estimate_tokens(sources[kind]) for kind in others)
+    if other_total > other_budget:
+        for kind in others:
+            share = other_budget * estimate_tokens(sources[kind]) // max(other_total, 1)
+            fitted[kind] = truncate_middle(sources[kind], share * 4, kind)
+            truncated.append(kind)
+    return fitted, truncated
+
+
+def reduce_sources(language, html_code, css_code, js_code, stages=None, budget=None, exact=()):
+    """Run the prompt reduction pipeline; returns (html, css, js, stats).
+
+    Kinds listed in `exact` are not rewritten, for sources the model has to hand back
+    intact. Raises PayloadError(413) when the target alone exceeds the budget.
+    """
+    stages = PROMPT_REDUCTION if stages is None else stages
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    sources = {'html': html_code, 'css': css_code, 'js': js_code}
+    before = ''.join(sources.values())
+    elided = []
+    truncated = []
+    if 'vendored' in stages:
+        sources = {kind: code if kind in exact else elide_vendored(code, kind, elided)
+                   for kind, code in sources.items()}
+    if 'comments' in stages:
+        sources = {kind: code if kind in exact else strip_comments(code, kind) for kind, code in sources.items()}
+    if 'whitespace' in stages:
+        sources = {kind: code if kind in exact else collapse_whitespace(code) for kind, code in sources.items()}
+    if 'budget' in stages and budget > 0:
+        sources, truncated = fit_budget(sources, language, budget)
+    after = ''.join(sources.values())
+    stats = {
+        'bytesBefore': len(before.encode('utf-8')),
+        'bytesAfter': len(after.encode('utf-8')),
+        'tokensBefore': estimate_tokens(before),
+        'tokensAfter': estimate_tokens(after),
+        'elidedLibraries': elided,
+        'truncated': truncated,
+    }
+    return sources['html'], sources['css'], sources['js'], stats
+
+
+# --- Edit (patch) response mode ---
+# With responseMode "edits" or "patch" the model answers with SEARCH/REPLACE blocks
+# against the submitted source instead of the whole file. "edits" applies them and
+# returns the patched code; "patch" returns the blocks themselves. Edits that do not
+# apply cleanly fall back to a normal full generation.
+RESPONSE_MODES = ('full', 'edits', 'patch')
+
+_EDIT_BLOCK = re.compile(r'^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$', re.S | re.M)
+
+
+class PatchError(ValueError):
+    """The model's edits could not be applied to the submitted source."""
+
+
+def source_kind(language):
+    """Which of html/css/js a request's language refers to."""
+    language = language.lower()
+    return 'js' if language in LANGUAGE_ALIASES['js'] else language
+
+
+def read_response_mode(data):
+    mode = str(data.get('responseMode') or 'full').lower()
+    return mode if mode in RESPONSE_MODES else 'full'
+
+
+def build_edit_messages(language, html_code, css_code, js_code, user_prompt):
+    """Like build_messages, but asks for SEARCH/REPLACE edits to the {language} source only."""
+    system_prompt = "You are a helpful coding assistant that improves code with small, exact edits."
+
+    prompt_content = f"""Enhance this {language.upper()} code. No external images and no external links.
+Everything should stay in one worker code. Create your own SVGs.
+
+Current HTML: {html_code}
+Current CSS: {css_code}
+Current JS: {js_code}
+
+User instructions: {user_prompt}
+
+Do not return the whole file. Reply only with edits to the {language.upper()} code, each in this form:
+<<<<<<< SEARCH
+exact lines copied from the current {language.upper()} code
+=======
+the lines that replace them
+>>>>>>> REPLACE
+Every SEARCH block must match the current code exactly, including whitespace, and occur only once in it.
+Keep the edits small and in file order. No explanations.
+"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def parse_edits(text):
+    """Return the (search, replace) pairs in a model response, in order."""
+    edits = [(match.group(1), match.group(2)) for match in _EDIT_BLOCK.finditer(text)]
+    if not edits:
+        raise PatchError("Response contained no SEARCH/REPLACE edits")
+    return edits
+
+
+def apply_edits(source, edits):
+    """Apply edits in order; each SEARCH must match exactly one place in the current text.
+
+    Returns (patched source, the edits as applied).
+    """
+    applied = []
+    for number, (search, replace) in enumerate(edits, 1):
+        if not search.strip():
+            if source.strip():
+                raise PatchError(f"Edit {number} has an empty SEARCH block")
+            source = replace
+            applied.append((search, replace))
+            continue
+        count = source.count(search)
+        if count == 0 and search.endswith('\n'):
+            # The last line of the file often has no trailing newline
+            search, replace = search.rstrip('\n'), replace.rstrip('\n')
+            count = source.count(search)
+        if count == 0:
+            raise PatchError(f"Edit {number}: SEARCH text not found in the source")
+        if count > 1:
+            raise PatchError(f"Edit {number}: SEARCH text matches {count} places")
+        source = source.replace(search, replace, 1)
+        applied.append((search, replace))
+    return source, applied
+
+
+def read_payload(data):
+    """Pull the generation inputs out of a /generate-code request body, applying defaults.
+
+    Missing and null fields get their defaults; anything else that is not a string
+    raises PayloadError(400).
+    """
+    fields = (
+        ('language', 'js'),
+        ('htmlCode', ''),
+        ('cssCode', ''),
+        ('jsCode', ''),
+        ('prompt', 'Enhance this code with best practices and optimizations'),
     )
-    
-    # Process the response
-    collected_output = ""
-    code_content = ""
-    is_inside_code_block = False
-    
-    for chunk in response:
-        if hasattr(chunk, 'choices') and chunk.choices[0].delta.content:
-            content = chunk.choices[0].delta.content
-            collected_output += content
-            
-            # Check for code block markers
-            if '```' in content:
-                parts = content.split('```')
-                for i in range(len(parts)):
-                    if i % 2 == 1:  # Inside code block
-                        code_content += parts[i].strip(language + '\n')
-                    elif is_inside_code_block:  # End of a code block
-                        code_content += parts[i]
-                        is_inside_code_block = False
-            elif is_inside_code_block:
-                code_content += content
-    
-    # Extract code if the model returned it with markdown formatting
-    if '```' in collected_output:
-        # Try to extract code between code blocks
-        code_blocks = collected_output.split('```')
-        for i in range(1, len(code_blocks), 2):
-            block = code_blocks[i]
-            if block.startswith(language) or block.startswith(language.lower()):
-                code_content = block.replace(language, '', 1).replace(language.lower(), '', 1).strip()
-                break
-        if not code_content:
-            code_content = collected_output
+    values = []
+    for name, default in fields:
+        value = data.get(name)
+        if value is None:
+            value = default
+        elif not isinstance(value, str):
+            raise PayloadError(400, f"{name} must be a string")
+        values.append(value)
+    return tuple(values)
+
+
+class GenerationOutput:
+    """Turns upstream deltas into what a flight publishes and the final, cached result.
+
+    The I/O-free half of run_generation, shared with the ASGI app. With `raw` the
+    response text is kept as is (edit mode parses it afterwards).
+    """
+
+    def __init__(self, key, language, raw, timings):
+        self.key = key
+        self.language = language
+        self.raw = raw
+        self.timings = timings
+        self.reset()
+
+    def reset(self):
+        """Forget everything fed so far, for an upstream call that starts over."""
+        self.extractor = CodeExtractor(self.language)
+        self.chunks = []
+
+    def feed(self, content):
+        """The text to publish for one upstream delta (may be empty)."""
+        self.timings.add_chunk(content)
+        if self.raw:
+            self.chunks.append(content)
+            return content
+        started = time.perf_counter()
+        code = self.extractor.feed(content)
+        self.timings.extraction += time.perf_counter() - started
+        return code
+
+    def finish(self):
+        """The text left to publish once the upstream stream has ended."""
+        if self.raw:
+            return ''
+        started = time.perf_counter()
+        code = self.extractor.finish()
+        self.timings.extraction += time.perf_counter() - started
+        return code
+
+    def complete(self):
+        """The final result, cached and recorded as a successful upstream call."""
+        started = time.perf_counter()
+        code = ''.join(self.chunks) if self.raw else self.extractor.result()
+        self.timings.extraction += time.perf_counter() - started
+        if response_cache:
+            response_cache.set(self.key, code)
+        self.timings.record("ok")
+        return code
+
+
+def run_generation(flight, language, messages, raw=False):
+    """Drive one upstream stream into `flight`, caching the extracted code on success."""
+    timings = UpstreamTimings()
+    output = GenerationOutput(flight.key, language, raw, timings)
+
+    def restart():
+        if not flight.restart():
+            return False
+        output.reset()
+        return True
+
+    try:
+        # Call the Together API through the shared client, with retries and fallbacks
+        for content in resilient_stream(messages, timings, restart):
+            code = output.feed(content)
+            if code:
+                flight.publish(code)
+        code = output.finish()
+        if code:
+            flight.publish(code)
+        flight.finish(result=output.complete())
+    except Exception as e:
+        app.logger.exception("Upstream generation failed")
+        timings.record("error")
+        flight.finish(error=e)
+    finally:
+        upstream_gate.release()
+        in_flight_generations.forget(flight)
+
+
+def start_generation(key, language, messages, raw=False):
+    """Attach to the in-flight generation for `key`, starting one if there is none.
+
+    Only the request that starts a generation queues for an upstream slot; if it is
+    turned away, everyone who attached to the flight meanwhile gets the same error.
+    """
+    if COALESCE_REQUESTS:
+        flight, is_leader = in_flight_generations.join(key)
     else:
-        # No code blocks, just return the entire output
-        code_content = collected_output
-    
-    app.logger.info("API call completed")
+        flight, is_leader = Flight(key), True
+    if is_leader:
+        try:
+            upstream_gate.acquire()
+        except Rejected as e:
+            rejected_total.inc(status=e.status)
+            flight.finish(error=e)
+            in_flight_generations.forget(flight)
+            raise
+        generation_executor.submit(run_generation, flight, language, messages, raw)
+    else:
+        coalesced_total.inc()
+        app.logger.info(f"Coalesced request onto in-flight generation {key[:12]}")
+    return flight, is_leader
+
+
+class Generation:
+    """A /generate-code request resolved to either a cached result or an upstream flight."""
+
+    def __init__(self, language, cached_code=None, flight=None, is_leader=False, prompt_stats=None,
+                 mode='full', source='', data=None, key=None, messages=None):
+        self.language = language
+        self.key = key
+        self.messages = messages  # What to send upstream, until a flight is attached
+        self.cached_code = cached_code
+        self.flight = flight
+        self.is_leader = is_leader
+        self.prompt_stats = prompt_stats
+        self.mode = mode
+        self.source = source  # The code the edits apply to
+        self.data = data
+        self.edits = None
+        self.fallback = None  # Full-mode Generation used when the edits did not apply
+        self.patch_error = None
+
+    @property
+    def cached(self):
+        return self.cached_code is not None
+
+    def coalescing_headers(self):
+        """X-Coalesced for a request that went upstream: 1 if it joined a flight another request started."""
+        if self.flight is None:
+            return {}
+        return {'X-Coalesced': '0' if self.is_leader else '1'}
+
+    def resolve(self, result):
+        """Turn the raw flight/cache result into code, applying edits in edit modes."""
+        if self.mode == 'full':
+            return result
+        code, self.edits = apply_edits(self.source, parse_edits(result))
+        patch_total.inc(outcome="applied")
+        return code
+
+    def fall_back(self, error):
+        """Record why the edits failed; returns the payload to rerun in full mode."""
+        app.logger.warning(f"Edits did not apply, falling back to a full generation: {error}")
+        patch_total.inc(outcome="fallback")
+        self.patch_error = str(error)
+        return dict(self.data, responseMode='full')
+
+    def wait(self):
+        result = self.cached_code if self.cached else self.flight.wait()
+        try:
+            return self.resolve(result)
+        except PatchError as e:
+            self.fallback = begin_generation(self.fall_back(e), track=False)
+            return self.fallback.wait()
+
+    def to_json(self, code):
+        if self.fallback is not None:
+            return dict(self.fallback.to_json(code), responseMode='full', patchError=self.patch_error)
+        if self.mode == 'patch' and self.edits is not None:
+            result = {'patch': [{'search': search, 'replace': replace} for search, replace in self.edits],
+                      'language': self.language}
+        else:
+            result = {'generatedCode': code, 'language': self.language}
+        if self.mode != 'full':
+            result['responseMode'] = self.mode
+        if self.cached:
+            result['cached'] = True
+        else:
+            result['promptStats'] = self.prompt_stats
+        return result
+
+
+def prepare_generation(data, track=True):
+    """The I/O-free half of begin_generation, shared with the ASGI app.
+
+    Returns a Generation served from the cache, or one carrying the `key` and
+    `messages` to start (or join) an upstream flight with.
+    """
+    language, html_code, css_code, js_code, user_prompt = read_payload(data)
+    mode = read_response_mode(data)
+    kind = source_kind(language)
+    source = {'html': html_code, 'css': css_code, 'js': js_code}.get(kind, '')
+
+    # Serve repeated payloads straight from the cache
+    key = cache_key(language, html_code, css_code, js_code, user_prompt, mode)
+    if track and payload_tracker:
+        payload_tracker.record(key, data)
+    cached_code = response_cache.get(key) if response_cache else None
+    if cached_code is not None:
+        app.logger.info(f"Cache hit for {key[:12]}")
+        return Generation(language, cached_code=cached_code, mode=mode, source=source, data=data)
+
+    started = time.perf_counter()
+    # The target is sent unreduced: full answers hand it back with its comments and layout,
+    # and SEARCH blocks have to quote it exactly
+    html_code, css_code, js_code, prompt_stats = reduce_sources(language, html_code, css_code, js_code,
+                                                                exact=(kind,))
+    build = build_messages if mode == 'full' else build_edit_messages
+    messages = build(language, html_code, css_code, js_code, user_prompt)
+    phase_seconds.observe(time.perf_counter() - started, phase="prompt_build")
+    prompt_tokens.observe(prompt_stats['tokensBefore'], stage="before")
+    prompt_tokens.observe(prompt_stats['tokensAfter'], stage="after")
+    app.logger.info(f"Prompt sources: {prompt_stats['bytesBefore']} -> {prompt_stats['bytesAfter']} bytes, "
+                    f"~{prompt_stats['tokensBefore']} -> ~{prompt_stats['tokensAfter']} tokens")
+    return Generation(language, prompt_stats=prompt_stats, mode=mode, source=source, data=data,
+                      key=key, messages=messages)
+
+
+def begin_generation(data, track=True):
+    """Look `data` up in the cache, or attach it to an upstream generation (starting one if needed)."""
+    generation = prepare_generation(data, track)
+    if not generation.cached:
+        generation.flight, generation.is_leader = start_generation(
+            generation.key, generation.language, generation.messages, raw=generation.mode != 'full')
+    return generation
+
+
+@app.route('/generate-code', methods=['POST'])
+def generate_code():
+    app.logger.info("Received request to /generate-code")
+
+    # Get the request data
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    phase_seconds.observe(time.perf_counter() - started, phase="parse")
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    app.logger.info(f"Request data: {request.content_length} bytes, "
+                    f"language={data.get('language')!r}, fields={sorted(data)}")
+
+    client = client_key(request.headers.get('X-API-Key'), request.remote_addr)
+    stream_format = negotiate_stream_format()
+
+    # One request can ask for several languages; they are generated concurrently
+    if 'languages' in data:
+        languages = read_languages(data)
+        if languages is None:
+            return jsonify({"error": "languages must be a non-empty list of html, css and js"}), 400
+        allowed, rejection = take_item_tokens(client, len(languages))
+        generations = begin_fan_out(data, languages[:allowed])
+        generations.update((language, rejection) for language in languages[allowed:])
+        if stream_format:
+            return stream_fan_out(generations, stream_format)
+        return jsonify({"results": {language: language_result(language, generation)
+                                    for language, generation in generations.items()}})
+
+    if rate_limiter:
+        rate_limiter.check(client)
+    generation = begin_generation(data)
+
+    if generation.cached and generation.mode == 'full':
+        if stream_format:
+            return stream_cached(generation.cached_code, generation.language, stream_format)
+        response = jsonify(generation.to_json(generation.cached_code))
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    # Edit-mode deltas are raw SEARCH/REPLACE text, so those streams only carry the result
+    if stream_format and generation.mode != 'full':
+        return stream_resolved(generation, stream_format)
+
+    # Opt-in streaming: forward code deltas as they arrive instead of buffering
+    if stream_format:
+        response = stream_generation(generation.flight, generation.language, stream_format,
+                                     generation.prompt_stats)
+        response.headers.update(generation.coalescing_headers())
+        return response
+
+    try:
+        code_content = generation.wait()
+    except (Rejected, UpstreamUnavailable, PayloadError):
+        raise
+    except Exception as e:
+        # Whatever else ended the generation, to the client it is a bad gateway
+        return jsonify({"error": str(e)}), 502
 
     # Return the collected output
-    return jsonify({
-        'generatedCode': code_content,
-        'language': language
-    })
+    response = jsonify(generation.to_json(code_content))
+    response.headers['X-Cache'] = 'HIT' if generation.cached else 'MISS'
+    response.headers.update(generation.coalescing_headers())
+    return response
+
+
+@app.route('/generate-code/batch', methods=['POST'])
+def generate_code_batch():
+    """Run many /generate-code payloads concurrently and report per-item status.
+
+    The body is a JSON array of /generate-code request objects (or {"requests": [...]}).
+    Results come back in order as {"results": [...]}, or, when a stream format is
+    negotiated, as one 'result' event per item in completion order followed by 'done'.
+    Each item takes a token from the client's rate limit; items beyond what is left
+    are reported with status 429, and the whole batch is refused if none are left.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a JSON array of generation requests"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch too large (max {BATCH_MAX_ITEMS} items)"}), 413
+    app.logger.info(f"Received batch of {len(items)} generation requests")
+
+    allowed, rejection = take_item_tokens(client_key(request.headers.get('X-API-Key'), request.remote_addr),
+                                          len(items))
+    rate_limited = [dict(error_result(rejection), index=index) for index in range(allowed, len(items))]
+
+    stream_format = negotiate_stream_format()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(BATCH_PARALLELISM, allowed)),
+                                  thread_name_prefix="batch")
+    futures = {executor.submit(run_batch_item, index, item): index for index, item in enumerate(items[:allowed])}
+    executor.shutdown(wait=False)
+
+    if stream_format:
+        def generate():
+            succeeded = 0
+            for result in rate_limited:
+                yield format_stream_event('result', result, stream_format)
+            for future in as_completed(futures):
+                result = future.result()
+                succeeded += result['status'] == 200
+                yield format_stream_event('result', result, stream_format)
+            yield format_stream_event('done', {'count': len(items), 'succeeded': succeeded,
+                                               'failed': len(items) - succeeded}, stream_format)
+
+        return stream_response(generate(), stream_format)
+
+    return jsonify({"results": [future.result() for future in futures] + rate_limited})
+
+
+def error_result(e):
+    """The per-item status reported for a failed batch item or fan-out language."""
+    if isinstance(e, (Rejected, UpstreamUnavailable)):
+        return {'status': e.status, 'error': str(e), 'retryAfter': e.retry_after}
+    if isinstance(e, PayloadError):
+        return {'status': e.status, 'error': str(e)}
+    return {'status': 502, 'error': str(e)}
+
+
+def run_batch_item(index, item):
+    if not isinstance(item, dict):
+        return {'index': index, 'status': 400, 'error': "Each batch item must be a JSON object"}
+    try:
+        generation = begin_generation(item)
+        result = generation.to_json(generation.wait())
+    except Exception as e:
+        return dict(error_result(e), index=index)
+    return dict(result, index=index, status=200)
+
+
+# --- Multi-language fan-out ---
+def read_languages(data):
+    """The distinct languages a fan-out request asks for, or None if `languages` is invalid."""
+    languages = data.get('languages')
+    if not isinstance(languages, list) or not languages:
+        return None
+    seen = {}
+    for language in languages:
+        if not isinstance(language, str) or source_kind(language) not in ('html', 'css', 'js'):
+            return None
+        seen.setdefault(source_kind(language), language)
+    return list(seen.values())
+
+
+def begin_fan_out(data, languages):
+    """Start every language's generation before waiting on any, so they run upstream side by side.
+
+    Maps each language to its Generation, or to the exception that kept it from starting.
+    """
+    generations = {}
+    for language in languages:
+        try:
+            generations[language] = begin_generation(dict(data, language=language))
+        except (Rejected, UpstreamUnavailable, PayloadError) as e:
+            generations[language] = e
+    return generations
+
+
+def language_result(language, generation):
+    if isinstance(generation, Exception):
+        return dict(error_result(generation), language=language)
+    try:
+        return dict(generation.to_json(generation.wait()), status=200)
+    except Exception as e:
+        return dict(error_result(e), language=language)
+
+
+def stream_fan_out(generations, stream_format):
+    """Interleave code deltas from every language (tagged with it), then one 'result' per language
+    in completion order, then 'done'."""
+    events = queue.Queue()
+
+    def pump(language, generation):
+        if isinstance(generation, Generation) and not generation.cached and generation.mode == 'full':
+            try:
+                for code in generation.flight.iter_deltas():
+                    events.put(('delta', {'language': language, 'code': code}))
+            except Exception:
+                pass  # Reported by the result below
+        events.put(('result', language_result(language, generation)))
+
+    executor = ThreadPoolExecutor(max_workers=len(generations), thread_name_prefix="fan-out")
+    for language, generation in generations.items():
+        executor.submit(pump, language, generation)
+    executor.shutdown(wait=False)
+
+    def generate():
+        remaining, succeeded = len(generations), 0
+        while remaining:
+            event, payload = events.get()
+            if event == 'result':
+                remaining -= 1
+                succeeded += payload['status'] == 200
+            yield format_stream_event(event, payload, stream_format)
+        yield format_stream_event('done', {'count': len(generations), 'succeeded': succeeded,
+                                           'failed': len(generations) - succeeded}, stream_format)
+
+    return stream_response(generate(), stream_format)
+
+STREAM_MIMETYPES = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def negotiate_stream_format():
+    """Return 'sse' or 'ndjson' when the client asked for a streamed response, else None."""
+    return pick_stream_format(request.args.get('stream', ''), request.headers.get('Accept', ''))
+
+
+def pick_stream_format(stream_arg, accept):
+    requested = stream_arg.lower()
+    if requested in STREAM_MIMETYPES:
+        return requested
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+
+def format_stream_event(event, payload, stream_format):
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(dict(payload, type=event)) + "\n"
+
+
+def iter_deltas(response):
+    """Yield the text content of each streamed chat-completion chunk."""
+    for chunk in response:
+        if hasattr(chunk, 'choices') and chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+LANGUAGE_ALIASES = {
+    'js': {'js', 'javascript', 'jsx', 'mjs'},
+    'javascript': {'js', 'javascript', 'jsx', 'mjs'},
+    'html': {'html', 'htm', 'xhtml'},
+    'css': {'css'},
+}
+
+
+_LINE_INDENT = re.compile(r'[ \t]*')
+
+
+class CodeExtractor:
+    """Incremental fenced-code parser fed chunk by chunk as the model streams.
+
+    Each character is looked at once: only the start of a line is held back, and
+    only until it is clear whether the line opens or closes a ``` fence, so fences
+    split across chunk boundaries are handled.
+
+    feed() only returns text that is sure to be part of result(): the inside of the
+    first block tagged with `language`, as it arrives, with its leading and trailing
+    whitespace trimmed. Prose and other blocks are held back; if no tagged block
+    turns up, finish() returns the whole result at once. Either way the returned
+    pieces add up to exactly result().
+    """
+
+    def __init__(self, language=''):
+        self._wanted = LANGUAGE_ALIASES.get(language.lower(), {language.lower()})
+        self._raw = []            # The chunks up to the first fence, for the no-fences result
+        self._blocks = []         # [(language tag, [parts])]
+        self._parts = None        # Parts of the block being read
+        self._inside = False
+        self._streaming = False   # Inside the block whose text feed() returns
+        self._streamed = False    # A block has been picked for feed() to return
+        self._started = False     # Past the streamed block's leading whitespace
+        self._trailing = ""       # Whitespace held back in case the streamed block ends after it
+        self._plain = False       # In the streamed block, past its leading whitespace, no fence pending
+        self._line_start = True
+        self._head = ""           # Start of the current line while it might still be a fence
+        self._ticks = 0           # Backticks seen in _head
+        self._fence_info = None   # Text after ``` on a fence line, collected until its newline
+
+    def feed(self, text):
+        """Consume one chunk and return the code text it revealed (possibly empty)."""
+        if not text:
+            return ''
+        if self._plain:
+            # Fast path, and the usual one: the block being streamed, with no fence in sight
+            if not self._line_start and '\n' not in text:
+                body = text
+            elif '`' not in text:
+                body = self._take_lines(text)
+                if not body:
+                    return ''
+            else:
+                body = None
+            if body is not None:
+                self._parts.append(body)
+                if self._trailing:
+                    body, self._trailing = self._trailing + body, ""
+                if not body[-1].isspace():
+                    return body
+                code = body.rstrip()
+                self._trailing = body[len(code):]
+                return code
+        if not self._blocks:
+            self._raw.append(text)
+        code = self._feed(text)
+        self._plain = self._streaming and self._started and self._fence_info is None and not self._ticks
+        return code
+
+    def _take_lines(self, text):
+        """Consume a chunk with no backtick in it that starts or ends a line.
+
+        With no backtick about, no fence can open or close here; only a last
+        line that is still blank so far might turn into one, so it is held back.
+        """
+        last = text.rfind('\n') + 1
+        if text[last:].strip(' \t'):
+            body, self._head, self._line_start = self._head + text, "", False
+        elif last:
+            body, self._head, self._line_start = self._head + text[:last], text[last:], True
+        else:
+            body, self._head = "", self._head + text
+        return body
+
+    def _feed(self, text):
+        if self._fence_info is None:
+            if not self._line_start and '\n' not in text:
+                # Fast path: the chunk sits in the middle of a line
+                body = text
+            elif not self._ticks and '`' not in text:
+                body = self._take_lines(text)
+                if not body:
+                    return ''
+            else:
+                body = None
+            if body is not None:
+                if not self._inside:
+                    return ''
+                self._parts.append(body)
+                if not self._streaming:
+                    return ''
+                return self._stream(body)
+        out = []
+        pos, n = 0, len(text)
+        while pos < n:
+            if self._fence_info is not None:
+                newline = text.find('\n', pos)
+                if newline == -1:
+                    self._fence_info.append(text[pos:])
+                    break
+                self._fence_info.append(text[pos:newline])
+                pos = newline + 1
+                self._end_fence_line()
+            elif self._line_start:
+                pos = self._scan_line_head(text, pos, out)
+            else:
+                newline = text.find('\n', pos)
+                end = n if newline == -1 else newline + 1
+                self._emit(text[pos:end], out)
+                pos = end
+                self._line_start = newline != -1
+        return ''.join(out)
+
+    def finish(self):
+        """Flush whatever is still held back once the stream has ended."""
+        out = []
+        if self._fence_info is not None:
+            self._end_fence_line()
+        elif self._head:
+            head, self._head, self._ticks = self._head, "", 0
+            self._emit(head, out)
+        if not self._streamed:
+            out.append(self.result())
+        return ''.join(out)
+
+    def result(self):
+        """Return the final code: the first block tagged with the language, else the first
+        block, else the whole response."""
+        if not self._blocks:
+            return ''.join(self._raw)
+        for tag, parts in self._blocks:
+            if tag in self._wanted:
+                return ''.join(parts).strip()
+        return ''.join(self._blocks[0][1]).strip()
+
+    def _scan_line_head(self, text, pos, out):
+        # Collect leading whitespace and up to three backticks, then decide.
+        n = len(text)
+        if not self._ticks:
+            match = _LINE_INDENT.match(text, pos)
+            if match.end() < n and text[match.end()] != '`':
+                # Common case: an ordinary line, no need to look at it char by char
+                head, self._head = self._head + match.group(), ""
+                self._line_start = False
+                self._emit(head, out)
+                return match.end()
+        while pos < n:
+            char = text[pos]
+            if char in ' \t' and not self._ticks:
+                self._head += char
+            elif char == '`':
+                self._ticks += 1
+                if self._ticks == 3:
+                    self._head, self._ticks = "", 0
+                    self._line_start = False
+                    self._fence_info = []
+                    return pos + 1
+                self._head += char
+            else:
+                head, self._head, self._ticks = self._head, "", 0
+                self._line_start = False
+                self._emit(head, out)
+                return pos
+            pos += 1
+        return pos
+
+    def _end_fence_line(self):
+        info = ''.join(self._fence_info).strip().lower()
+        self._fence_info = None
+        self._line_start = True
+        if self._inside:
+            self._inside = self._streaming = False
+        else:
+            tag = info.split()[0] if info else ''
+            self._inside = True
+            self._parts = []
+            self._blocks.append((tag, self._parts))
+            # Only the first block in the requested language is certain to be the result
+            self._streaming = not self._streamed and tag in self._wanted
+            self._streamed = self._streamed or self._streaming
+
+    def _emit(self, text, out):
+        if not text or not self._inside:
+            return
+        self._parts.append(text)
+        if self._streaming:
+            out.append(self._stream(text))
+
+    def _stream(self, text):
+        """Trim the streamed block's leading and trailing whitespace as its text arrives."""
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ''
+            self._started = True
+        body = text.rstrip()
+        if not body:
+            self._trailing += text
+            return ''
+        held, self._trailing = self._trailing, text[len(body):]
+        return held + body
+
+
+def stream_response(events, stream_format, cache_status=None):
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if cache_status:
+        headers['X-Cache'] = cache_status
+    return Response(
+        stream_with_context(events),
+        mimetype=STREAM_MIMETYPES[stream_format],
+        headers=headers
+    )
+
+
+def stream_cached(code, language, stream_format):
+    """Replay a cached generation as a single delta plus the usual summary event."""
+    def generate():
+        yield format_stream_event('delta', {'code': code}, stream_format)
+        yield format_stream_event('done', {'generatedCode': code, 'language': language, 'cached': True},
+                                  stream_format)
+
+    return stream_response(generate(), stream_format, 'HIT')
+
+
+def stream_generation(flight, language, stream_format, prompt_stats=None):
+    """Stream code deltas from `flight` to the client, ending with a summary event."""
+    def generate():
+        try:
+            for code in flight.iter_deltas():
+                yield format_stream_event('delta', {'code': code}, stream_format)
+            code = flight.wait()
+        except Exception as e:
+            yield format_stream_event('error', {'error': str(e)}, stream_format)
+            return
+
+        yield format_stream_event('done', {
+            'generatedCode': code,
+            'language': language,
+            'promptStats': prompt_stats
+        }, stream_format)
+
+    return stream_response(generate(), stream_format, 'MISS')
+
+
+def stream_resolved(generation, stream_format):
+    """Stream an edit-mode generation: one 'done' event once the edits are applied (or fell back)."""
+    def generate():
+        try:
+            code = generation.wait()
+        except Exception as e:
+            yield format_stream_event('error', {'error': str(e)}, stream_format)
+            return
+        yield format_stream_event('done', generation.to_json(code), stream_format)
+
+    return stream_response(generate(), stream_format, 'HIT' if generation.cached else 'MISS')
+
+
+class InFlightMiddleware:
+    """WSGI middleware counting requests from arrival until their response body is closed.
+
+    Streamed responses stay counted while they stream, and each request is counted
+    exactly once (teardown_request runs more than once under stream_with_context).
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _finish(self):
+        with self._lock:
+            self.active -= 1
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.active += 1
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._finish()
+            raise
+        return ClosingIterator(response, self._finish)
+
+
+in_flight_requests = InFlightMiddleware(app.wsgi_app)
+app.wsgi_app = in_flight_requests
+
+
+@app.before_request
+def start_request_timer():
+    request.environ['app.started'] = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    started = request.environ.get('app.started')
+    if started is not None:
+        request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if request.content_length:
+        request_bytes.observe(request.content_length, endpoint=endpoint)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    if not COMPRESS_RESPONSES or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    encoding = pick_encoding(request.headers.get('Accept-Encoding', ''))
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, StreamCompressor(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        compressor = StreamCompressor(encoding)
+        response.set_data(compressor.compress(body, flush=False) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def in_flight_counts():
+    return {
+        "requests": in_flight_requests.active,
+        "generations": in_flight_generations.in_flight(),
+        "upstreamActive": upstream_gate.active,
+        "upstreamQueued": upstream_gate.waiting,
+    }
+
+
+metrics.register(Gauge("http_requests_in_flight", "Requests currently being handled",
+                       lambda: in_flight_requests.active))
+metrics.register(Gauge("generate_code_generations_in_flight", "Distinct upstream generations in progress",
+                       lambda: in_flight_generations.in_flight()))
+metrics.register(Gauge("generate_code_upstream_active", "Upstream slots in use", lambda: upstream_gate.active))
+metrics.register(Gauge("generate_code_circuits_open", "Upstream models whose circuit breaker is open",
+                       lambda: sum(breaker.state == "open" for breaker in circuit_breakers.values())))
+metrics.register(Gauge("generate_code_upstream_queued", "Requests waiting for an upstream slot",
+                       lambda: upstream_gate.waiting))
+if response_cache:
+    metrics.register(Gauge("generate_code_cache_hits", "Response cache hits (memory and disk)",
+                           lambda: response_cache.hits + response_cache.disk_hits))
+    metrics.register(Gauge("generate_code_cache_misses", "Response cache misses", lambda: response_cache.misses))
+
 
 @app.route('/ping', methods=['GET'])
 def ping():
-    return jsonify({"status": "ok", "message": "Server is running"})
+    return jsonify({"status": "ok", "message": "Server is running", "inFlight": in_flight_counts()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats() if response_cache else {"enabled": False})
+
+# --- Speculative prefetch ---
+class PayloadTracker:
+    """Counts recently seen payloads so the most requested ones can be kept warm.
+
+    Counts are kept for `max_entries` payload keys, but bodies (up to
+    MAX_REQUEST_BYTES each) only for the `keep` most frequent ones.
+    """
+
+    def __init__(self, max_entries, keep):
+        self.max_entries = max_entries
+        self.keep = keep
+        self._counts = OrderedDict()  # key -> count, least recently seen first
+        self._payloads = {}           # key -> payload, for the current top `keep` keys
+        self._lock = threading.Lock()
+
+    def record(self, key, payload):
+        with self._lock:
+            count = self._counts[key] = self._counts.get(key, 0) + 1
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                dropped, _ = self._counts.popitem(last=False)
+                self._payloads.pop(dropped, None)
+            if key in self._payloads or len(self._payloads) < self.keep:
+                self._payloads[key] = payload
+                return
+            # Take the place of the least requested payload kept, if this one overtook it
+            weakest = min(self._payloads, key=self._counts.__getitem__)
+            if count > self._counts[weakest]:
+                del self._payloads[weakest]
+                self._payloads[key] = payload
+
+    def top(self, n):
+        with self._lock:
+            ranked = sorted(self._payloads.items(), key=lambda item: self._counts[item[0]], reverse=True)
+        return ranked[:n]
+
+
+class Prefetcher:
+    """Replays configured and popular payloads through the pipeline so their results are cached.
+
+    Runs one generation at a time, only while the upstream gate has spare capacity,
+    and never spends more than `budget` generations per `window` seconds.
+    """
+
+    def __init__(self, payloads_file, top_n, interval, budget, window):
+        self.payloads_file = payloads_file
+        self.top_n = top_n
+        self.interval = interval
+        self.budget = budget
+        self.window = window
+        self.spent = []  # Start times of generations inside the current window
+        self.warmed = 0
+        self.already_cached = 0
+        self.failed = 0
+        self.last_run = None
+        self.last_error = None
+        self._extra = []  # Payloads queued through POST /prefetch
+        self.gate = upstream_gate  # Whose load decides whether upstream is idle enough to prefetch
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None  # Process the thread runs in; a forked worker inherits this but not the thread
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="prefetch", daemon=True).start()
+                self._pid = os.getpid()
+                app.logger.info(f"Prefetch started (budget {self.budget} per {self.window:.0f}s)")
+
+    def trigger(self, payloads=()):
+        with self._lock:
+            self._extra.extend(payloads)
+        self.start()
+        self._wake.set()
+
+    def budget_left(self):
+        now = time.time()
+        with self._lock:
+            self.spent = [started for started in self.spent if now - started < self.window]
+            return max(0, self.budget - len(self.spent))
+
+    def load_configured(self):
+        """Payloads from PREFETCH_PAYLOADS_FILE; htmlFile/cssFile/jsFile entries are read relative to it."""
+        if not self.payloads_file:
+            return []
+        with open(self.payloads_file, encoding='utf-8') as f:
+            entries = json.load(f)
+        base = os.path.dirname(os.path.abspath(self.payloads_file))
+        payloads = []
+        for entry in entries:
+            payload = dict(entry)
+            for field, file_field in (('htmlCode', 'htmlFile'), ('cssCode', 'cssFile'), ('jsCode', 'jsFile')):
+                if file_field in payload:
+                    with open(os.path.join(base, payload.pop(file_field)), encoding='utf-8') as source:
+                        payload[field] = source.read()
+            payloads.append(payload)
+        return payloads
+
+    def candidates(self):
+        with self._lock:
+            payloads, self._extra = self._extra, []
+        try:
+            payloads += self.load_configured()
+        except (IOError, ValueError) as e:
+            self.last_error = f"Could not read {self.payloads_file}: {e}"
+            app.logger.warning(self.last_error)
+        if payload_tracker:
+            payloads += [payload for key, payload in payload_tracker.top(self.top_n)]
+        return payloads
+
+    def upstream_idle(self):
+        return self.gate.waiting == 0 and self.gate.active < max(1, self.gate.limit // 2)
+
+    def run_once(self):
+        self.last_run = time.time()
+        seen = set()
+        for payload in self.candidates():
+            key = cache_key(*read_payload(payload), read_response_mode(payload))
+            if key in seen:
+                continue
+            seen.add(key)
+            if response_cache.contains(key):
+                self.already_cached += 1
+                continue
+            if not self.budget_left():
+                app.logger.info("Prefetch budget exhausted, stopping this run")
+                return
+            if not self.upstream_idle():
+                app.logger.info("Upstream busy, deferring prefetch to the next run")
+                return
+            with self._lock:
+                self.spent.append(time.time())
+            try:
+                begin_generation(payload, track=False).wait()
+                self.warmed += 1
+                prefetch_total.inc(outcome="warmed")
+            except Exception as e:
+                self.failed += 1
+                self.last_error = str(e)
+                prefetch_total.inc(outcome="failed")
+                app.logger.warning(f"Prefetch of {key[:12]} failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                app.logger.exception("Prefetch run failed")
+            if self.interval > 0:
+                self._wake.wait(self.interval)
+            else:
+                self._wake.wait()
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "budget": self.budget,
+            "budgetWindow": self.window,
+            "budgetLeft": self.budget_left(),
+            "warmed": self.warmed,
+            "alreadyCached": self.already_cached,
+            "failed": self.failed,
+            "lastRun": self.last_run,
+            "lastError": self.last_error,
+        }
+
+
+prefetch_total = metrics.register(Counter(
+    "generate_code_prefetch_total", "Speculative generations by outcome", labelnames=("outcome",)))
+payload_tracker = PayloadTracker(PREFETCH_TRACK_ENTRIES, PREFETCH_TOP_N) if PREFETCH_ENABLED and PREFETCH_TOP_N > 0 else None
+# Results only help if they land in the response cache
+prefetcher = Prefetcher(PREFETCH_PAYLOADS_FILE, PREFETCH_TOP_N, PREFETCH_INTERVAL, PREFETCH_BUDGET,
+                        PREFETCH_BUDGET_WINDOW) if PREFETCH_ENABLED and response_cache else None
+# Start warming as soon as a server imports the app (gunicorn, flask run, the ASGI app), except in the
+# debug reloader's watcher process, which never serves; the hook below restarts it in forked workers.
+if prefetcher and not (__name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"):
+    prefetcher.start()
+
+
+@app.before_request
+def ensure_prefetching():
+    if prefetcher:
+        prefetcher.start()
+
+
+def may_queue_prefetch(admin_key, remote_addr):
+    """POST /prefetch spends the warming budget: it takes PREFETCH_ADMIN_KEY, or a local caller when none is set."""
+    if PREFETCH_ADMIN_KEY:
+        return hmac.compare_digest((admin_key or '').encode(), PREFETCH_ADMIN_KEY.encode())
+    return remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/prefetch', methods=['GET', 'POST'])
+def prefetch():
+    if not prefetcher:
+        return jsonify({"enabled": False, "error": "Prefetch needs PREFETCH_ENABLED=1 and the response cache"}), 404
+    if request.method == 'POST':
+        if not may_queue_prefetch(request.headers.get('X-Admin-Key'), request.remote_addr):
+            return jsonify({"error": "Queueing prefetches needs the admin key"}), 403
+        data = request.get_json(silent=True) or {}
+        payloads = data.get('payloads', []) if isinstance(data, dict) else data
+        if not isinstance(payloads, list) or not all(isinstance(p, dict) for p in payloads):
+            return jsonify({"error": "Expected a list of generation payloads"}), 400
+        prefetcher.trigger(payloads)
+        return jsonify(dict(prefetcher.stats(), queued=len(payloads))), 202
+    return jsonify(prefetcher.stats())
+
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
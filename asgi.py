@@ -0,0 +1,690 @@
+"""Async (ASGI) serving path for the code generation API.
+
+Run with an ASGI server, e.g.:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Each request only holds a coroutine while it waits on Together, so one process
+can keep hundreds of generations in flight while /ping stays responsive. Prompt
+construction, the retry policy, caching and incremental code extraction are
+shared with the Flask app in app.py; only the I/O loops live here, with the
+upstream call going through AsyncTogether instead.
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+import together
+from together import AsyncTogether
+
+from app import (
+    app as flask_app, MODEL_PARAMS, TOGETHER_API_KEY, COALESCE_REQUESTS, STREAM_MIMETYPES,
+    UPSTREAM_POOL_SIZE, UPSTREAM_KEEPALIVE, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_FIRST_TOKEN_TIMEOUT, UPSTREAM_IDLE_TIMEOUT, UpstreamTimeout, UpstreamUnavailable, UpstreamAttempts,
+    UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE_LIMIT, UPSTREAM_QUEUE_TIMEOUT, Rejected, rate_limiter, client_key,
+    take_item_tokens, BATCH_MAX_ITEMS, BATCH_PARALLELISM, Generation, GenerationOutput, prepare_generation,
+    metrics, Gauge, UpstreamTimings, phase_seconds, coalesced_total, rejected_total,
+    response_cache, prefetcher, may_queue_prefetch, pick_stream_format, format_stream_event, PatchError,
+    error_result, read_languages,
+    MAX_REQUEST_BYTES, COMPRESS_RESPONSES, COMPRESS_MIN_BYTES, COMPRESSIBLE_MIMETYPES,
+    PayloadError, decode_body, pick_encoding, StreamCompressor,
+)
+
+logger = flask_app.logger
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+# --- Shared async Together client ---
+_async_client = None
+
+
+def get_async_together_client():
+    # Created on first use so it binds to the server's event loop.
+    global _async_client
+    if _async_client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=UPSTREAM_POOL_SIZE,
+                                max_keepalive_connections=UPSTREAM_KEEPALIVE),
+            timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        )
+        _async_client = AsyncTogether(api_key=TOGETHER_API_KEY, http_client=http_client, max_retries=0)
+        logger.info(f"Created async Together client (pool size {UPSTREAM_POOL_SIZE})")
+    return _async_client
+
+
+async def close_async_together_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+# --- Admission control ---
+class AsyncAdmissionGate:
+    """asyncio counterpart of app.AdmissionGate."""
+
+    def __init__(self, limit, queue_limit, timeout):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._changed:
+            if self.active < self.limit:
+                self.active += 1
+                return
+            if self.waiting >= self.queue_limit:
+                raise Rejected(503, "Server busy, upstream queue is full", self.timeout)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.active < self.limit), self.timeout)
+                self.active += 1
+            except asyncio.TimeoutError:
+                raise Rejected(503, "Server busy, timed out waiting for an upstream slot", self.timeout)
+            finally:
+                self.waiting -= 1
+
+    async def release(self):
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify()
+
+
+upstream_gate = AsyncAdmissionGate(UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE_LIMIT, UPSTREAM_QUEUE_TIMEOUT)
+
+
+# --- Request coalescing (single-flight) ---
+class AsyncFlight:
+    """asyncio counterpart of app.Flight: one upstream generation shared by identical requests."""
+
+    def __init__(self, key):
+        self.key = key
+        self.deltas = []
+        self.delivered = False
+        self.done = False
+        self.result = None
+        self.error = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, content):
+        async with self._changed:
+            self.deltas.append(content)
+            self._changed.notify_all()
+
+    def restart(self):
+        # No await between the check and the reset, so no reader can slip in
+        if self.delivered:
+            return False
+        self.deltas = []
+        return True
+
+    async def finish(self, result=None, error=None):
+        async with self._changed:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    async def iter_deltas(self):
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.deltas) or self.done)
+                pending = self.deltas[index:]
+                finished = self.done
+                self.delivered = self.delivered or bool(pending)
+            index += len(pending)
+            for content in pending:
+                yield content
+            if finished and index >= len(self.deltas):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def wait(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+_flights = {}
+_tasks = set()  # Strong references so running generations are not garbage collected
+# Prompt preparation is CPU-bound regex work that holds the GIL; one thread at a time
+# leaves the event loop a fair share of it during a burst, where a thread each would not
+_prepare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prepare")
+
+
+async def stream_once(model, messages, timings):
+    """Async counterpart of app.stream_once; deadlines are enforced with asyncio timeouts."""
+    deadline = time.monotonic() + UPSTREAM_FIRST_TOKEN_TIMEOUT
+    try:
+        response = await asyncio.wait_for(get_async_together_client().chat.completions.create(
+            messages=messages,
+            stream=True,
+            **dict(MODEL_PARAMS, model=model)
+        ), UPSTREAM_FIRST_TOKEN_TIMEOUT)
+    except (asyncio.TimeoutError, together.APITimeoutError) as e:
+        raise UpstreamTimeout(f"{model} did not respond in time") from e
+    timings.mark_connected()
+    chunks = response.__aiter__()
+    phase = "first token"
+    try:
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if phase == "first token" else UPSTREAM_IDLE_TIMEOUT
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError as e:
+                raise UpstreamTimeout(f"{model} missed its {phase} deadline") from e
+            if hasattr(chunk, 'choices') and chunk.choices and chunk.choices[0].delta.content:
+                phase = "idle"
+                yield chunk.choices[0].delta.content
+    finally:
+        await response.close()
+
+
+async def resilient_stream(messages, timings, restart=None):
+    """Async counterpart of app.resilient_stream; the policy itself is app.UpstreamAttempts."""
+    attempts = UpstreamAttempts(restart)
+    for model, breaker in attempts:
+        produced = False
+        try:
+            async for content in stream_once(model, messages, timings):
+                produced = True
+                yield content
+            attempts.succeeded(model, breaker)
+            return
+        except Exception as e:
+            delay = attempts.failed(model, breaker, e, produced)
+            if delay:
+                await asyncio.sleep(delay)
+    raise attempts.exhausted() from attempts.last_error
+
+
+async def run_generation(flight, language, messages, raw=False):
+    """Async counterpart of app.run_generation."""
+    timings = UpstreamTimings()
+    output = GenerationOutput(flight.key, language, raw, timings)
+
+    def restart():
+        if not flight.restart():
+            return False
+        output.reset()
+        return True
+
+    try:
+        async for content in resilient_stream(messages, timings, restart):
+            code = output.feed(content)
+            if code:
+                await flight.publish(code)
+        code = output.finish()
+        if code:
+            await flight.publish(code)
+        # Extraction and the cache write (SQLite, with CACHE_DB_PATH) block; keep them off the event loop
+        await flight.finish(result=await asyncio.to_thread(output.complete))
+    except Exception as e:
+        logger.exception("Upstream generation failed")
+        timings.record("error")
+        await flight.finish(error=e)
+    finally:
+        await upstream_gate.release()
+        forget(flight)
+
+
+def forget(flight):
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+
+
+async def start_generation(key, language, messages, raw=False):
+    flight = _flights.get(key) if COALESCE_REQUESTS else None
+    if flight is not None:
+        coalesced_total.inc()
+        logger.info(f"Coalesced request onto in-flight generation {key[:12]}")
+        return flight, False
+    flight = AsyncFlight(key)
+    if COALESCE_REQUESTS:
+        _flights[key] = flight
+    try:
+        await upstream_gate.acquire()
+    except Rejected as e:
+        rejected_total.inc(status=e.status)
+        await flight.finish(error=e)
+        forget(flight)
+        raise
+    task = asyncio.create_task(run_generation(flight, language, messages, raw))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return flight, True
+
+
+# --- ASGI plumbing ---
+async def read_body(scope, receive):
+    """Read and decode the request body, raising PayloadError past MAX_REQUEST_BYTES."""
+    headers = dict(scope["headers"])
+    try:
+        length = int(headers.get(b"content-length", b"0"))
+    except ValueError:
+        length = 0
+    if length > MAX_REQUEST_BYTES:
+        raise PayloadError(413, f"Request body exceeds {MAX_REQUEST_BYTES} bytes")
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_REQUEST_BYTES:
+            raise PayloadError(413, f"Request body exceeds {MAX_REQUEST_BYTES} bytes")
+        if not message.get("more_body"):
+            return decode_body(body, headers.get(b"content-encoding", b"").decode("latin-1"), MAX_REQUEST_BYTES)
+
+
+def compressing_send(scope, send):
+    """Wrap `send` so compressible responses are encoded per the client's Accept-Encoding.
+
+    Each body message is flushed through the compressor, so streamed events are not held back.
+    """
+    encoding = pick_encoding(dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1"))
+    if not COMPRESS_RESPONSES or encoding is None:
+        return send
+    compressor = None
+
+    async def wrapped(message):
+        nonlocal compressor
+        if message["type"] == "http.response.start":
+            headers = dict(message.get("headers", []))
+            mimetype = headers.get(b"content-type", b"").split(b";")[0].decode("latin-1")
+            length = headers.get(b"content-length")
+            if (mimetype in COMPRESSIBLE_MIMETYPES and b"content-encoding" not in headers
+                    and (length is None or int(length) >= COMPRESS_MIN_BYTES)):
+                compressor = StreamCompressor(encoding)
+                message = dict(message, headers=[(name, value) for name, value in message["headers"]
+                                                 if name != b"content-length"]
+                               + [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")])
+        elif message["type"] == "http.response.body" and compressor is not None:
+            body = compressor.compress(message.get("body", b""))
+            if not message.get("more_body"):
+                body += compressor.finish()
+            message = dict(message, body=body)
+        await send(message)
+
+    return wrapped
+
+
+async def send_rejected(send, e):
+    if e.status == 429:
+        rejected_total.inc(status=e.status)
+    retry_after = str(max(1, int(e.retry_after + 0.999))).encode()
+    await send_json(send, {"error": str(e)}, status=e.status, headers=[(b"retry-after", retry_after)])
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())] + CORS_HEADERS + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_stream(send, events, stream_format, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", STREAM_MIMETYPES[stream_format].encode()),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")] + CORS_HEADERS + list(headers),
+    })
+    async for event in events:
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def stream_flight(flight, language, stream_format, prompt_stats=None):
+    try:
+        async for code in flight.iter_deltas():
+            yield format_stream_event('delta', {'code': code}, stream_format)
+        result = await flight.wait()
+    except Exception as e:
+        yield format_stream_event('error', {'error': str(e)}, stream_format)
+        return
+    yield format_stream_event('done', {'generatedCode': result, 'language': language,
+                                       'promptStats': prompt_stats}, stream_format)
+
+
+async def stream_cached(code, language, stream_format):
+    yield format_stream_event('delta', {'code': code}, stream_format)
+    yield format_stream_event('done', {'generatedCode': code, 'language': language, 'cached': True},
+                              stream_format)
+
+
+async def begin_generation(data, track=True):
+    """Async counterpart of app.begin_generation; the returned Generation holds an AsyncFlight.
+
+    The prompt reduction and the cache lookup run on a worker thread: both block,
+    for tens of milliseconds on large sources, and would stall every other stream.
+    """
+    generation = await asyncio.get_running_loop().run_in_executor(_prepare_executor, prepare_generation,
+                                                                   data, track)
+    if not generation.cached:
+        generation.flight, generation.is_leader = await start_generation(
+            generation.key, generation.language, generation.messages, raw=generation.mode != 'full')
+    return generation
+
+
+async def resolve_generation(generation):
+    """Async counterpart of Generation.wait: the final code, after applying edits or falling back."""
+    result = generation.cached_code if generation.cached else await generation.flight.wait()
+    try:
+        return await asyncio.to_thread(generation.resolve, result)
+    except PatchError as e:
+        generation.fallback = await begin_generation(generation.fall_back(e), track=False)
+        return await resolve_generation(generation.fallback)
+
+
+async def stream_resolved(generation, stream_format):
+    try:
+        code = await resolve_generation(generation)
+    except Exception as e:
+        yield format_stream_event('error', {'error': str(e)}, stream_format)
+        return
+    yield format_stream_event('done', generation.to_json(code), stream_format)
+
+
+def parse_request(scope):
+    headers = dict(scope["headers"])
+    query = parse_qs(scope.get("query_string", b"").decode())
+    stream_format = pick_stream_format(query.get('stream', [''])[0], headers.get(b"accept", b"").decode())
+    client = scope.get("client") or ("", 0)
+    return client_key(headers.get(b"x-api-key", b"").decode(), client[0]), stream_format
+
+
+async def read_json(scope, receive, send):
+    try:
+        started = time.perf_counter()
+        data = json.loads(await read_body(scope, receive) or b"{}")
+        phase_seconds.observe(time.perf_counter() - started, phase="parse")
+        return data
+    except PayloadError as e:
+        await send_json(send, {"error": str(e)}, status=e.status)
+        return None
+    except ValueError:
+        await send_json(send, {"error": "Request body must be JSON"}, status=400)
+        return None
+
+
+async def generate_code(scope, receive, send):
+    logger.info("Received request to /generate-code (async)")
+    data = await read_json(scope, receive, send)
+    if data is None:
+        return
+    if not isinstance(data, dict):
+        await send_json(send, {"error": "Request body must be a JSON object"}, status=400)
+        return
+    client, stream_format = parse_request(scope)
+
+    try:
+        if 'languages' in data:
+            await generate_code_multi(send, client, data, stream_format)
+            return
+        if rate_limiter:
+            rate_limiter.check(client)
+        generation = await begin_generation(data)
+    except Rejected as e:
+        await send_rejected(send, e)
+        return
+    except PayloadError as e:
+        await send_json(send, {"error": str(e)}, status=e.status)
+        return
+
+    if generation.cached and generation.mode == 'full':
+        if stream_format:
+            await send_stream(send, stream_cached(generation.cached_code, generation.language, stream_format),
+                              stream_format, [(b"x-cache", b"HIT")])
+        else:
+            await send_json(send, generation.to_json(generation.cached_code), headers=[(b"x-cache", b"HIT")])
+        return
+
+    extra = [(b"x-cache", b"HIT" if generation.cached else b"MISS")]
+    extra += [(name.lower().encode(), value.encode()) for name, value in generation.coalescing_headers().items()]
+    if stream_format and generation.mode != 'full':
+        await send_stream(send, stream_resolved(generation, stream_format), stream_format, extra)
+        return
+    if stream_format:
+        await send_stream(send, stream_flight(generation.flight, generation.language, stream_format,
+                                              generation.prompt_stats), stream_format, extra)
+        return
+
+    try:
+        code = await resolve_generation(generation)
+    except Exception as e:
+        # The same statuses the Flask app's error handlers give
+        error = error_result(e)
+        if error.get('retryAfter') is not None:
+            extra.append((b"retry-after", str(max(1, int(error['retryAfter'] + 0.999))).encode()))
+        await send_json(send, {"error": error['error']}, status=error['status'], headers=extra)
+        return
+    await send_json(send, generation.to_json(code), headers=extra)
+
+
+async def run_batch_item(index, item, limit):
+    if not isinstance(item, dict):
+        return {'index': index, 'status': 400, 'error': "Each batch item must be a JSON object"}
+    async with limit:
+        try:
+            generation = await begin_generation(item)
+            code = await resolve_generation(generation)
+        except Exception as e:
+            return dict(error_result(e), index=index)
+    return dict(generation.to_json(code), index=index, status=200)
+
+
+async def begin_fan_out(data, languages):
+    """Async counterpart of app.begin_fan_out."""
+    generations = {}
+    for language in languages:
+        try:
+            generations[language] = await begin_generation(dict(data, language=language))
+        except (Rejected, UpstreamUnavailable, PayloadError) as e:
+            generations[language] = e
+    return generations
+
+
+async def language_result(language, generation):
+    if isinstance(generation, Exception):
+        return dict(error_result(generation), language=language)
+    try:
+        return dict(generation.to_json(await resolve_generation(generation)), status=200)
+    except Exception as e:
+        return dict(error_result(e), language=language)
+
+
+async def stream_fan_out(generations, stream_format):
+    """Async counterpart of app.stream_fan_out."""
+    events = asyncio.Queue()
+
+    async def pump(language, generation):
+        if isinstance(generation, Generation) and not generation.cached and generation.mode == 'full':
+            try:
+                async for code in generation.flight.iter_deltas():
+                    await events.put(('delta', {'language': language, 'code': code}))
+            except Exception:
+                pass  # Reported by the result below
+        await events.put(('result', await language_result(language, generation)))
+
+    tasks = [asyncio.create_task(pump(language, generation)) for language, generation in generations.items()]
+    remaining, succeeded = len(tasks), 0
+    while remaining:
+        event, payload = await events.get()
+        if event == 'result':
+            remaining -= 1
+            succeeded += payload['status'] == 200
+        yield format_stream_event(event, payload, stream_format)
+    yield format_stream_event('done', {'count': len(tasks), 'succeeded': succeeded,
+                                       'failed': len(tasks) - succeeded}, stream_format)
+
+
+async def generate_code_multi(send, client, data, stream_format):
+    """Async counterpart of the multi-language branch of app.generate_code."""
+    languages = read_languages(data)
+    if languages is None:
+        await send_json(send, {"error": "languages must be a non-empty list of html, css and js"}, status=400)
+        return
+    allowed, rejection = take_item_tokens(client, len(languages))
+    generations = await begin_fan_out(data, languages[:allowed])
+    generations.update((language, rejection) for language in languages[allowed:])
+    if stream_format:
+        await send_stream(send, stream_fan_out(generations, stream_format), stream_format)
+        return
+    results = await asyncio.gather(*(language_result(language, generation)
+                                     for language, generation in generations.items()))
+    await send_json(send, {"results": dict(zip(generations, results))})
+
+
+async def generate_code_batch(scope, receive, send):
+    """Async counterpart of app.generate_code_batch."""
+    data = await read_json(scope, receive, send)
+    if data is None:
+        return
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        await send_json(send, {"error": "Expected a JSON array of generation requests"}, status=400)
+        return
+    if len(items) > BATCH_MAX_ITEMS:
+        await send_json(send, {"error": f"Batch too large (max {BATCH_MAX_ITEMS} items)"}, status=413)
+        return
+    client, stream_format = parse_request(scope)
+    try:
+        allowed, rejection = take_item_tokens(client, len(items))
+    except Rejected as e:
+        await send_rejected(send, e)
+        return
+    rate_limited = [dict(error_result(rejection), index=index) for index in range(allowed, len(items))]
+
+    limit = asyncio.Semaphore(BATCH_PARALLELISM)
+    tasks = [asyncio.create_task(run_batch_item(index, item, limit)) for index, item in enumerate(items[:allowed])]
+
+    if stream_format:
+        async def events():
+            succeeded = 0
+            for result in rate_limited:
+                yield format_stream_event('result', result, stream_format)
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                succeeded += result['status'] == 200
+                yield format_stream_event('result', result, stream_format)
+            yield format_stream_event('done', {'count': len(items), 'succeeded': succeeded,
+                                               'failed': len(items) - succeeded}, stream_format)
+
+        await send_stream(send, events(), stream_format)
+        return
+
+    await send_json(send, {"results": list(await asyncio.gather(*tasks)) + rate_limited})
+
+
+async def prefetch(scope, receive, send):
+    """Async counterpart of app.prefetch."""
+    if not prefetcher:
+        await send_json(send, {"enabled": False,
+                               "error": "Prefetch needs PREFETCH_ENABLED=1 and the response cache"}, status=404)
+        return
+    if scope["method"] == "POST":
+        headers = dict(scope["headers"])
+        client = scope.get("client") or ("", 0)
+        if not may_queue_prefetch(headers.get(b"x-admin-key", b"").decode(), client[0]):
+            await send_json(send, {"error": "Queueing prefetches needs the admin key"}, status=403)
+            return
+        try:
+            data = json.loads(await read_body(scope, receive) or b"{}")
+        except PayloadError as e:
+            await send_json(send, {"error": str(e)}, status=e.status)
+            return
+        except ValueError:
+            data = None
+        payloads = data.get('payloads', []) if isinstance(data, dict) else data
+        if not isinstance(payloads, list) or not all(isinstance(p, dict) for p in payloads):
+            await send_json(send, {"error": "Expected a list of generation payloads"}, status=400)
+            return
+        prefetcher.trigger(payloads)
+        await send_json(send, dict(prefetcher.stats(), queued=len(payloads)), status=202)
+        return
+    await send_json(send, prefetcher.stats())
+
+
+def in_flight_counts():
+    return {
+        "generations": len(_flights),
+        "upstreamActive": upstream_gate.active,
+        "upstreamQueued": upstream_gate.waiting,
+    }
+
+
+if prefetcher:
+    # Prefetch runs on its own thread through the Flask pipeline; back off on this app's load
+    prefetcher.gate = upstream_gate
+
+
+metrics.register(Gauge("asgi_generations_in_flight", "Distinct upstream generations in progress (ASGI app)",
+                       lambda: len(_flights)))
+metrics.register(Gauge("asgi_upstream_active", "Upstream slots in use (ASGI app)", lambda: upstream_gate.active))
+metrics.register(Gauge("asgi_upstream_queued", "Requests waiting for an upstream slot (ASGI app)",
+                       lambda: upstream_gate.waiting))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if prefetcher:
+                prefetcher.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_together_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    send = compressing_send(scope, send)
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+    elif path == "/generate-code" and method == "POST":
+        await generate_code(scope, receive, send)
+    elif path == "/generate-code/batch" and method == "POST":
+        await generate_code_batch(scope, receive, send)
+    elif path == "/ping" and method == "GET":
+        await send_json(send, {"status": "ok", "message": "Server is running", "inFlight": in_flight_counts()})
+    elif path == "/metrics" and method == "GET":
+        body = metrics.render().encode("utf-8")
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain; version=0.0.4")]})
+        await send({"type": "http.response.body", "body": body})
+    elif path == "/prefetch" and method in ("GET", "POST"):
+        await prefetch(scope, receive, send)
+    elif path == "/cache-stats" and method == "GET":
+        await send_json(send, response_cache.stats() if response_cache else {"enabled": False})
+    else:
+        await send_json(send, {"error": "Not found"}, status=404)
@@ -0,0 +1,113 @@
+"""Micro-benchmark: incremental CodeExtractor vs. the old split-based chunk loop.
+
+Usage:
+    python benchmarks/bench_extractor.py [--sizes 10000,100000,1000000] [--repeat 3]
+
+Builds long synthetic model outputs (prose, a tagged fence, code, a closing fence)
+and replays them as small random chunks, the way Together streams them. Before
+timing, every stream is checked to extract the same code as feeding the whole
+text at once, so fences straddling chunk boundaries are exercised too.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOGETHER_API_KEY", "unused")  # app refuses to import without one; never sent here
+
+from app import CodeExtractor  # noqa: E402
+
+
+def legacy_extract(chunks, language):
+    """The chunk loop generate_code used before CodeExtractor, kept for comparison."""
+    collected_output = ""
+    code_content = ""
+    is_inside_code_block = False
+    for content in chunks:
+        collected_output += content
+        if '```' in content:
+            parts = content.split('```')
+            for i in range(len(parts)):
+                if i % 2 == 1:
+                    code_content += parts[i].strip(language + '\n')
+                elif is_inside_code_block:
+                    code_content += parts[i]
+                    is_inside_code_block = False
+        elif is_inside_code_block:
+            code_content += content
+    if '```' in collected_output:
+        code_blocks = collected_output.split('```')
+        for i in range(1, len(code_blocks), 2):
+            block = code_blocks[i]
+            if block.startswith(language):
+                code_content = block.replace(language, '', 1).strip()
+                break
+        if not code_content:
+            code_content = collected_output
+    else:
+        code_content = collected_output
+    return code_content
+
+
+def incremental_extract(chunks, language):
+    extractor = CodeExtractor(language)
+    for content in chunks:
+        extractor.feed(content)
+    extractor.finish()
+    return extractor.result()
+
+
+def synthetic_output(size, rng):
+    line = "    const value = items.map((item) => item * 2); // `inline` ticks\n"
+    body = (line * (size // len(line) + 1))[:size]
+    return f"Here is the improved code:\n```js\n{body}\n```\nLet me know if you need anything else."
+
+
+def chunked(text, rng, low=1, high=12):
+    chunks, pos = [], 0
+    while pos < len(text):
+        step = rng.randint(low, high)
+        chunks.append(text[pos:pos + step])
+        pos += step
+    return chunks
+
+
+def check(text, chunks):
+    whole = CodeExtractor('js')
+    whole.feed(text)
+    whole.finish()
+    assert incremental_extract(chunks, 'js') == whole.result(), "chunking changed the extracted code"
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'chars':>10} {'chunks':>8} {'legacy ms':>10} {'incremental ms':>15} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        text = synthetic_output(size, rng)
+        chunks = chunked(text, rng)
+        check(text, chunks)
+        legacy = best_of(args.repeat, legacy_extract, chunks, 'js')
+        incremental = best_of(args.repeat, incremental_extract, chunks, 'js')
+        print(f"{len(text):>10} {len(chunks):>8} {legacy * 1000:>10.1f} {incremental * 1000:>15.1f} "
+              f"{legacy / incremental:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Micro-benchmark: compiled UrlMatcher vs. the linear any() scan browser.py used to run.
+
+Usage:
+    python benchmarks/bench_url_filter.py [--sizes 100,1000,10000,50000] [--urls 2000]
+
+Builds synthetic blocklists of host-like entries (plus some path fragments), and a
+mix of URLs that hit and miss them. Before timing, every URL is checked to get the
+same verdict from both implementations.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from url_filter import UrlMatcher  # noqa: E402
+
+TLDS = ("com", "net", "org", "io", "store", "co.uk")
+
+
+def random_host(rng):
+    labels = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+              for _ in range(rng.randint(1, 3))]
+    return ".".join(labels) + "." + rng.choice(TLDS)
+
+
+def make_patterns(size, rng):
+    patterns = set()
+    while len(patterns) < size:
+        if rng.random() < 0.9:
+            patterns.add(random_host(rng))
+        else:
+            patterns.add("/" + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 8))) + "/")
+    return sorted(patterns)
+
+
+def make_urls(patterns, count, rng):
+    urls = []
+    for _ in range(count):
+        path = "/".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+                        for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.2:
+            host = rng.choice(patterns).strip("/")  # A hit (hosts, or a path fragment used as a host label)
+        else:
+            host = random_host(rng)
+        urls.append(f"https://{host}/{path}?q={rng.randint(0, 10 ** 6)}")
+    return urls
+
+
+def linear_scan(patterns, urls):
+    """The check acceptNavigationRequest used before UrlMatcher, kept for comparison."""
+    verdicts = []
+    for url in urls:
+        url = url.lower()
+        verdicts.append(any(pattern in url for pattern in patterns))
+    return verdicts
+
+
+def compiled_scan(matcher, urls):
+    return [matcher.matches(url) for url in urls]
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000,50000')
+    parser.add_argument('--urls', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'entries':>8} {'build ms':>9} {'linear us/url':>14} {'compiled us/url':>16} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        patterns = make_patterns(size, rng)
+        urls = make_urls(patterns, args.urls, rng)
+        start = time.perf_counter()
+        matcher = UrlMatcher(patterns)
+        build = time.perf_counter() - start
+        assert compiled_scan(matcher, urls) == linear_scan(patterns, urls), "verdicts differ"
+        linear = best_of(args.repeat, linear_scan, patterns, urls) / len(urls)
+        compiled = best_of(args.repeat, compiled_scan, matcher, urls) / len(urls)
+        print(f"{size:>8} {build * 1000:>9.1f} {linear * 1e6:>14.1f} {compiled * 1e6:>16.1f} "
+              f"{linear / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
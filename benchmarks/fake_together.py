@@ -0,0 +1,202 @@
+"""Local stand-in for Together's chat-completions API, for benchmarks and offline runs.
+
+Usage:
+    python benchmarks/fake_together.py --port 8765 --token-rate 200 --first-token-latency 0.3
+
+then point the server at it:
+    TOGETHER_BASE_URL=http://127.0.0.1:8765/v1 TOGETHER_API_KEY=fake python app.py
+
+POST /v1/chat/completions answers with the same server-sent-events stream the real
+API produces ("data: {chunk}" lines ending in "data: [DONE]"), or a single JSON
+completion when stream is false. Token rate, chunk sizes, where the markdown
+fences land and error injection are all configurable.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FENCE_STYLES = ("none", "wrapped", "prose", "split")
+
+CODE_LINE = "    const total = values.reduce((sum, value) => sum + value, 0);\n"
+
+
+class FakeConfig:
+    def __init__(self, token_rate=200.0, first_token_latency=0.2, output_chars=4000, chunk_min=2, chunk_max=8,
+                 fence="prose", error_rate=0.0, midstream_error_rate=0.0, seed=None):
+        self.token_rate = token_rate                    # Chunks per second once streaming
+        self.first_token_latency = first_token_latency  # Seconds before the first chunk
+        self.output_chars = output_chars
+        self.chunk_min = chunk_min
+        self.chunk_max = chunk_max
+        self.fence = fence
+        self.error_rate = error_rate                    # Fraction of requests failing with 429/500 up front
+        self.midstream_error_rate = midstream_error_rate  # Fraction failing with an error event mid-stream
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def chunk_sizes(self, total):
+        with self.lock:
+            sizes = []
+            while total > 0:
+                size = min(total, self.random.randint(self.chunk_min, self.chunk_max))
+                sizes.append(size)
+                total -= size
+            return sizes
+
+
+def completion_text(config, language):
+    body = (CODE_LINE * (config.output_chars // len(CODE_LINE) + 1))[:config.output_chars]
+    if config.fence == "none":
+        return body
+    if config.fence == "wrapped":
+        return f"```{language}\n{body}\n```"
+    if config.fence == "split":
+        # Two blocks; only the second is tagged with the requested language
+        return f"Markup first:\n```html\n<div></div>\n```\nAnd the script:\n```{language}\n{body}\n```\n"
+    return f"Here is the improved code:\n\n```{language}\n{body}\n```\n\nThis version is faster and cleaner."
+
+
+def make_handler(config):
+    class FakeTogetherHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so client connection pooling is exercised
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "Not found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if config.roll(config.error_rate):
+                status = 429 if config.roll(0.5) else 500
+                self.send_json(status, {"error": {"message": f"Injected upstream error ({status})"}})
+                return
+
+            language = "js"
+            prompt = request.get("messages", [{}])[-1].get("content", "")
+            for candidate in ("html", "css", "js"):
+                if f"Enhance this {candidate.upper()} code" in prompt:
+                    language = candidate
+            text = completion_text(config, language)
+            model = request.get("model", "fake-model")
+            completion_id = f"fake-{uuid.uuid4().hex[:12]}"
+
+            time.sleep(config.first_token_latency)
+            if not request.get("stream"):
+                self.send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            fail_at = None
+            sizes = config.chunk_sizes(len(text))
+            if config.roll(config.midstream_error_rate):
+                fail_at = len(sizes) // 2
+            delay = 1.0 / config.token_rate if config.token_rate > 0 else 0
+            pos = 0
+            try:
+                for index, size in enumerate(sizes):
+                    if index == fail_at:
+                        self.write_event({"error": {"message": "Injected mid-stream error"}})
+                        break
+                    self.write_event({
+                        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": text[pos:pos + size]}, "finish_reason": None}],
+                    })
+                    pos += size
+                    if delay:
+                        time.sleep(delay)
+                self.write_chunk(b"data: [DONE]\n\n")
+                self.write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def write_event(self, payload):
+            self.write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+        def write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FakeTogetherHandler
+
+
+class FakeTogetherServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Pooled clients drop idle keep-alive connections; that is not worth a traceback.
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def start_fake_server(config, host="127.0.0.1", port=0):
+    """Start the fake API on a background thread; returns (server, base_url)."""
+    server = FakeTogetherServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name="fake-together", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_arguments(parser):
+    parser.add_argument("--token-rate", type=float, default=200.0, help="chunks per second while streaming")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="seconds before the first chunk")
+    parser.add_argument("--output-chars", type=int, default=4000, help="characters of code per completion")
+    parser.add_argument("--chunk-min", type=int, default=2, help="smallest chunk, in characters")
+    parser.add_argument("--chunk-max", type=int, default=8, help="largest chunk, in characters")
+    parser.add_argument("--fence", choices=FENCE_STYLES, default="prose", help="where markdown fences appear")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing up front")
+    parser.add_argument("--midstream-error-rate", type=float, default=0.0,
+                        help="fraction of streams failing halfway through")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return FakeConfig(token_rate=args.token_rate, first_token_latency=args.first_token_latency,
+                      output_chars=args.output_chars, chunk_min=args.chunk_min, chunk_max=args.chunk_max,
+                      fence=args.fence, error_rate=args.error_rate, midstream_error_rate=args.midstream_error_rate,
+                      seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Together chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start_fake_server(config_from_args(args), args.host, args.port)
+    print(f"Fake Together API listening on {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
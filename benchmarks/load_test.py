@@ -0,0 +1,239 @@
+"""Load test /generate-code against the fake Together server, without spending API credits.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 64
+    python benchmarks/load_test.py --stream sse --fence split --token-rate 500
+    python benchmarks/load_test.py --target http://127.0.0.1:5000   # e.g. uvicorn asgi:app
+
+By default this starts benchmarks/fake_together.py in a child process and the
+Flask app (threaded werkzeug server) in this one, with the response cache and
+rate limiter off so every request really goes upstream. For each concurrency
+level it reports
+latency percentiles, time to first byte, requests per second and the resident
+memory added per in-flight request (sampled from /proc, so Linux only and
+approximate: client threads are included).
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_together import add_arguments  # noqa: E402
+
+FAKE_SERVER_OPTIONS = ("token_rate", "first_token_latency", "output_chars", "chunk_min", "chunk_max", "fence",
+                       "error_rate", "midstream_error_rate", "seed")
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, ValueError, AttributeError):
+        return None
+
+
+def start_fake_upstream(args):
+    """Run fake_together.py in its own process so it doesn't compete with the app for the GIL."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_together.py"),
+               "--port", str(port)]
+    for option in FAKE_SERVER_OPTIONS:
+        value = getattr(args, option)
+        if value is not None:
+            command += ["--" + option.replace("_", "-"), str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Fake Together server did not start")
+
+
+def start_app(upstream_url):
+    """Import app.py configured for the fake upstream and serve it on a background thread."""
+    os.environ["TOGETHER_BASE_URL"] = upstream_url
+    os.environ.setdefault("TOGETHER_API_KEY", "fake-key")
+    os.environ.setdefault("CACHE_ENABLED", "0")
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("UPSTREAM_QUEUE_LIMIT", "100000")
+    os.environ.setdefault("UPSTREAM_QUEUE_TIMEOUT", "600")
+    import logging
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    app_module.app.logger.setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_payload(index, args):
+    # Unique prompts unless --repeat is set, so coalescing/caching don't hide upstream cost
+    prompt = "Enhance this code" if args.repeat else f"Enhance this code (run {args.run_id}, request {index})"
+    return json.dumps({
+        "language": args.language,
+        "htmlCode": "<div id='app'></div>",
+        "cssCode": "#app { color: red; }",
+        "jsCode": "document.getElementById('app').textContent = 'hi';\n" * args.js_lines,
+        "prompt": prompt,
+    }).encode("utf-8")
+
+
+def one_request(target, index, args):
+    parts = urlsplit(target)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=args.timeout)
+    headers = {"Content-Type": "application/json"}
+    if args.stream:
+        headers["Accept"] = "text/event-stream" if args.stream == "sse" else "application/x-ndjson"
+    started = time.perf_counter()
+    try:
+        conn.request("POST", "/generate-code", body=make_payload(index, args), headers=headers)
+        response = conn.getresponse()
+        first = response.read(1)
+        ttfb = time.perf_counter() - started
+        body = first + response.read()
+        latency = time.perf_counter() - started
+        status = response.status
+        if status == 200 and args.stream and b'"error"' in body:
+            status = "stream-error"  # Streams report upstream failures in-band, after a 200
+        return {"status": status, "ok": status == 200, "latency": latency, "ttfb": ttfb, "bytes": len(body)}
+    except Exception as e:
+        return {"status": type(e).__name__, "ok": False, "latency": time.perf_counter() - started,
+                "ttfb": None, "bytes": 0}
+    finally:
+        conn.close()
+
+
+def run_level(target, concurrency, total, args):
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+    baseline = rss_bytes()
+    peak = [baseline]
+    stop_sampling = threading.Event()
+
+    def sample_memory():
+        while not stop_sampling.wait(0.05):
+            current = rss_bytes()
+            if current is not None and (peak[0] is None or current > peak[0]):
+                peak[0] = current
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            result = one_request(target, index, args)
+            with lock:
+                results.append(result)
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    sampler.join()
+
+    latencies = [r["latency"] for r in results if r["ok"]]
+    ttfbs = [r["ttfb"] for r in results if r["ok"] and r["ttfb"] is not None]
+    per_request_mb = None
+    if baseline is not None and peak[0] is not None:
+        per_request_mb = max(peak[0] - baseline, 0) / concurrency / 1e6
+    failures = {}
+    for r in results:
+        if not r["ok"]:
+            failures[r["status"]] = failures.get(r["status"], 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "ttfb_p50": percentile(ttfbs, 0.50),
+        "ttfb_p95": percentile(ttfbs, 0.95),
+        "mb_per_in_flight": per_request_mb,
+        "failures": failures,
+    }
+
+
+def print_report(rows):
+    header = (f"{'conc':>5} {'reqs':>5} {'ok':>5} {'rps':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+              f"{'ttfb50':>7} {'ttfb95':>7} {'MB/req':>7}  failures")
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        memory = f"{row['mb_per_in_flight']:.2f}" if row["mb_per_in_flight"] is not None else "n/a"
+        print(f"{row['concurrency']:>5} {row['requests']:>5} {row['ok']:>5} {row['rps']:>8.2f} "
+              f"{row['p50']:>7.3f} {row['p95']:>7.3f} {row['p99']:>7.3f} {row['ttfb_p50']:>7.3f} "
+              f"{row['ttfb_p95']:>7.3f} {memory:>7}  {row['failures'] or ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for /generate-code")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--stream", choices=("", "sse", "ndjson"), default="", help="use a streaming response mode")
+    parser.add_argument("--language", default="js")
+    parser.add_argument("--js-lines", type=int, default=50, help="lines of jsCode in each payload")
+    parser.add_argument("--repeat", action="store_true", help="send identical payloads (exercises coalescing)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--target", help="benchmark an already running server instead of starting app.py")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    args.run_id = int(time.time())
+
+    fake_process = app_server = None
+    target = args.target
+    if not target:
+        fake_process, upstream_url = start_fake_upstream(args)
+        app_server, target = start_app(upstream_url)
+
+    try:
+        rows = [run_level(target, int(level), args.requests, args) for level in args.concurrency.split(",")]
+    finally:
+        if app_server:
+            app_server.shutdown()
+        if fake_process:
+            fake_process.terminate()
+            fake_process.wait()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
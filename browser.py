@@ -1,21 +1,62 @@
 import sys
 import os
-from PyQt5.QtCore import QUrl, Qt, QSize, QDateTime, QMetaObject, pyqtSlot, Q_ARG
+import html
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+PROCESS_STARTED = time.perf_counter() # Startup profile origin; the interpreter's own start-up isn't included
+from PyQt5.QtCore import QUrl, Qt, QSize, QTimer, QMetaObject, pyqtSlot, Q_ARG, QBuffer, QIODevice
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QToolBar, QAction, QLineEdit, QStatusBar,
     QDialog, QVBoxLayout, QHBoxLayout, QListWidget, QPushButton, QDialogButtonBox,
-    QMessageBox, QStyle, QLabel
+    QMessageBox, QStyle, QLabel, QFileDialog, QTabWidget
 )
-from PyQt5.QtGui import QIcon, QFont # Added QFont
-from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
+from PyQt5.QtGui import QIcon, QFont, QKeySequence # Added QFont
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineProfile
+from PyQt5.QtWebEngineCore import QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
+try:
+    from PyQt5.QtWebEngineCore import QWebEngineUrlScheme
+except ImportError: # Qt < 5.12: custom schemes work without being registered
+    QWebEngineUrlScheme = None
+
+from list_store import UrlListStore
+from url_filter import UrlFilter, FilterStats
 
 # --- Configuration ---
 WHITELIST_FILE = "whitelist.txt"
 BLACKLIST_FILE = "blacklist.txt"
+LIST_DB_FILE = "url_lists.db" # Both lists live here; the .txt files above are imported into it once
+LIST_PAGE_SIZE = 200 # Entries the list dialogs show at a time
 LOG_FILE = "browser_activity.log"
+LOG_FORMAT = "text" # "text" for the classic lines, "jsonl" for one JSON object per event
+LOG_MAX_BYTES = 5 * 1024 * 1024 # Rotate the log once it grows past this size
+LOG_BACKUP_COUNT = 3 # Rotated files kept: browser_activity.log.1 ... .3
+LOG_FLUSH_INTERVAL = 1.0 # Seconds a written event may sit in the buffer before it hits disk
+LOG_QUEUE_LIMIT = 10000 # Events waiting for the writer; beyond this they are dropped (and counted)
+LOG_SUPPRESS_WINDOW = 30.0 # Identical navigation log lines are written once per window, then as a count
+NAV_DECISION_CACHE_SIZE = 4096 # Recent allow/block decisions remembered per URL
+FILTER_STATS_INTERVAL_MS = 2000 # How often the status bar's filter statistics are refreshed
+BLOCKED_STATUS_INTERVAL_MS = 1000 # Blocked requests are summarised in the status bar at most this often
+BLOCKED_RECENT_COUNT = 10 # Recently blocked URLs listed in the counter's tooltip
+BLOCKED_PAGE_SCHEME = "kiosk-blocked" # Local origin the "blocked" page is served from
+BLOCKED_PAGES_KEPT = 50 # Blocked pages that can still be revisited through history
 DEFAULT_HOME_URL = "https://play.imaginea.store"
 APP_NAME = "Imaginea Secure Browser"
 APP_ICON_PATH = "icons/app_icon.png" # Ensure this icon exists in 'icons' folder
+STARTUP_PROFILE = "--startup-profile" in sys.argv or os.environ.get("BROWSER_STARTUP_PROFILE") == "1" # Log per-phase startup timings
+WEBENGINE_INIT_FALLBACK_MS = 500 # Create the web view after this long even if the first paint was never seen
+PROFILE_NAME = "kiosk" # Named profiles keep cookies and cache on disk across sessions
+PROFILE_STORAGE_PATH = "browser_profile" # Cookies, local storage, IndexedDB
+PROFILE_CACHE_PATH = os.path.join(PROFILE_STORAGE_PATH, "cache") # HTTP disk cache
+PROFILE_CACHE_MAX_BYTES = 512 * 1024 * 1024 # 0 lets WebEngine size the cache itself
+PRELOAD_URLS = [] # Fetched in a hidden page once the browser is idle, e.g. DEFAULT_HOME_URL + "/main.js"
+PRELOAD_IDLE_MS = 15000 # Quiet time after the last page load before preloading starts
+MAX_LIVE_TABS = 4 # Tabs kept loaded; the least recently used hidden tabs beyond this are discarded (0 = no limit)
+TAB_MIN_AVAILABLE_MB = 400 # Below this much available RAM, one hidden tab is discarded per check (Linux; 0 = off)
+TAB_FREEZE_DELAY_MS = 30000 # A hidden tab is frozen (no timers or scripts) after this long
+TAB_MEMORY_CHECK_INTERVAL_MS = 10000 # How often the tab ceiling and available memory are checked
 
 # --- Icon Paths (relative to the script location) ---
 ICON_FOLDER = "icons"
@@ -29,6 +70,27 @@ ICON_WHITELIST = os.path.join(ICON_FOLDER, "whitelist.png")
 ICON_BLACKLIST = os.path.join(ICON_FOLDER, "blacklist.png")
 ICON_ADD = os.path.join(ICON_FOLDER, "add.png")
 ICON_REMOVE = os.path.join(ICON_FOLDER, "remove.png")
+ICON_CACHE = os.path.join(ICON_FOLDER, "cache.png")
+ICON_NEW_TAB = os.path.join(ICON_FOLDER, "new_tab.png")
+ICON_CLOSE_TAB = os.path.join(ICON_FOLDER, "close_tab.png")
+
+_icon_files = None
+
+def find_icon(path):
+    """QIcon for `path`, or None (with a warning) if it doesn't exist.
+
+    The icons folder is listed once instead of stat'ing every icon during startup.
+    """
+    global _icon_files
+    if _icon_files is None:
+        try:
+            _icon_files = {os.path.normpath(os.path.join(ICON_FOLDER, name)) for name in os.listdir(ICON_FOLDER)}
+        except OSError:
+            _icon_files = set()
+    if os.path.normpath(path) in _icon_files:
+        return QIcon(path)
+    print(f"Warning: Icon not found at {path}")
+    return None
 
 
 # --- Global Stylesheet (QSS) ---
@@ -157,55 +219,444 @@ STYLESHEET = """
 
 
 # --- Logging ---
+class ActivityLogger:
+    """Writes log events from a background thread so callers on the GUI thread never touch the disk.
+
+    Events are queued with their timestamp and written in batches to a file that stays
+    open; the buffer is flushed every `flush_interval` seconds, on flush() and on close().
+    """
+
+    def __init__(self, filename, log_format="text", max_bytes=0, backup_count=0,
+                 flush_interval=1.0, queue_limit=10000):
+        self.filename = filename
+        self.log_format = log_format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_limit)
+        self._file = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="activity-logger", daemon=True)
+        self._thread.start()
+
+    def log(self, event_type, message):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait((time.time(), event_type, message))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until everything logged so far is on disk."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        flushed = self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if not flushed:
+            print(f"Warning: some log events may not have reached {self.filename}")
+
+    def format(self, timestamp, event_type, message):
+        if self.log_format == "jsonl":
+            return json.dumps({"ts": round(timestamp, 3), "event": event_type, "message": message}) + "\n"
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        return f"[{stamp}.{int(timestamp * 1000) % 1000:03d}] [{event_type.ljust(20)}] {message}\n"
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            batch, waiters, stop = [], [], False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item:
+                    batch.append(self.format(*item))
+                if stop or len(batch) >= 500:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if self.dropped and batch:
+                batch.append(self.format(time.time(), "LOGGER", f"{self.dropped} events dropped (queue full)"))
+                self.dropped = 0
+            if batch:
+                self._write("".join(batch))
+            if waiters or stop or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush_file()
+                last_flush = time.monotonic()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, text):
+        try:
+            if self._file is None:
+                self._file = open(self.filename, "a", encoding="utf-8")
+            if self.max_bytes and self._file.tell() + len(text) > self.max_bytes and self._file.tell() > 0:
+                self._rotate()
+            self._file.write(text)
+        except (IOError, OSError) as e:
+            print(f"Error writing to log file {self.filename}: {e}")
+            self._file = None
+
+    def _flush_file(self):
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except (IOError, OSError) as e:
+                print(f"Error flushing log file {self.filename}: {e}")
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for number in range(self.backup_count - 1, 0, -1):
+                older = f"{self.filename}.{number}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.filename}.{number + 1}")
+            os.replace(self.filename, f"{self.filename}.1")
+        else:
+            os.remove(self.filename)
+        self._file = open(self.filename, "a", encoding="utf-8")
+
+
+activity_logger = ActivityLogger(LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                                 LOG_FLUSH_INTERVAL, LOG_QUEUE_LIMIT)
+
+
 def log_event(event_type, message):
-    timestamp = QDateTime.currentDateTime().toString("yyyy-MM-dd hh:mm:ss.zzz")
-    log_entry = f"[{timestamp}] [{event_type.ljust(20)}] {message}\n"
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(log_entry)
-    except IOError as e:
-        print(f"Error writing to log file {LOG_FILE}: {e}")
+    activity_logger.log(event_type, message)
+
+
+class StartupProfile:
+    """Marks how far into startup each phase finished; logged once as a STARTUP_PROFILE event."""
+
+    def __init__(self, enabled, started):
+        self.enabled = enabled
+        self.started = started
+        self.marks = []
+        self.reported = False
+
+    def mark(self, phase):
+        # Called from the list loader thread too; list.append is atomic
+        if self.enabled and not self.reported:
+            self.marks.append((phase, time.perf_counter() - self.started))
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        phases = ", ".join(f"{phase}=+{elapsed * 1000:.0f}ms" for phase, elapsed in self.marks)
+        log_event("STARTUP_PROFILE", f"{APP_NAME} startup: {phases}")
+
+
+startup_profile = StartupProfile(STARTUP_PROFILE, PROCESS_STARTED)
+
+
+class LogSuppressor:
+    """Collapses repeats of the same event into one line per window plus a repeat count."""
+
+    def __init__(self, window):
+        self.window = window
+        self.suppressed = 0
+        self._seen = {} # (event_type, key) -> [window start, repeats, latest message]
+
+    def log(self, event_type, key, message):
+        now = time.monotonic()
+        entry = self._seen.get((event_type, key))
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            entry[2] = message
+            self.suppressed += 1
+            return
+        if entry is not None:
+            self._report(event_type, entry)
+        self._seen[(event_type, key)] = [now, 0, message]
+        log_event(event_type, message)
+
+    def flush(self, everything=False):
+        """Write the counts of windows that have ended (or of all windows) and forget them."""
+        now = time.monotonic()
+        for (event_type, key), entry in list(self._seen.items()):
+            if everything or now - entry[0] >= self.window:
+                self._report(event_type, entry)
+                del self._seen[(event_type, key)]
+
+    def _report(self, event_type, entry):
+        if entry[1]:
+            log_event(event_type, f"{entry[2]} (repeated {entry[1]}x in {self.window:g}s)")
 
 # --- Custom Web Engine Page for Whitelist/Blacklist ---
+BLOCKED_PAGE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Blocked</title>
+<style>
+    body {{ background: #2E3440; color: #D8DEE9; font-family: sans-serif; margin: 15% auto; max-width: 40em; }}
+    h1 {{ color: #BF616A; font-weight: normal; }}
+    code {{ color: #ECEFF4; word-break: break-all; }}
+    a {{ color: #88C0D0; }}
+</style></head>
+<body>
+<h1>Access blocked</h1>
+<p>Access to <code>{url}</code> was blocked.</p>
+<p>Reason: {reason}</p>
+<p><a href="javascript:history.back()">Go back</a> &middot; <a href="{home}">Home</a></p>
+</body></html>
+"""
+
+
+def register_blocked_page_scheme():
+    """Declare the blocked page's scheme as local, so web pages cannot load or link to it.
+
+    Must run before the QApplication is created.
+    """
+    if QWebEngineUrlScheme is None:
+        return
+    scheme = QWebEngineUrlScheme(BLOCKED_PAGE_SCHEME.encode())
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+    scheme.setFlags(QWebEngineUrlScheme.LocalScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class BlockedPageHandler(QWebEngineUrlSchemeHandler):
+    """Serves the "blocked" page at kiosk-blocked:<id>, an origin of its own.
+
+    The blocked URL and reason are kept here by id, so the URL only ever appears in the page body.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pages = OrderedDict()
+        self.last_id = 0
+
+    def page_url(self, url, reason):
+        self.last_id += 1
+        self.pages[self.last_id] = (url, reason)
+        while len(self.pages) > BLOCKED_PAGES_KEPT:
+            self.pages.popitem(last=False)
+        return QUrl(f"{BLOCKED_PAGE_SCHEME}:{self.last_id}")
+
+    def requestStarted(self, job):
+        try:
+            url, reason = self.pages[int(job.requestUrl().path())]
+        except (KeyError, ValueError):
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        body = BLOCKED_PAGE_HTML.format(url=html.escape(url), reason=html.escape(reason),
+                                        home=html.escape(DEFAULT_HOME_URL))
+        buffer = QBuffer(job) # Owned by the job, freed with it
+        buffer.setData(body.encode("utf-8"))
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(b"text/html", buffer)
+
+
+class BlockedCounter:
+    """Counts blocked navigations; the window reads it on a timer instead of reacting to each one."""
+
+    def __init__(self, keep):
+        self.total = 0
+        self.pending = 0 # Blocked since the status bar last showed the count
+        self.recent = deque(maxlen=keep)
+
+    def record(self, url, reason):
+        self.total += 1
+        self.pending += 1
+        self.recent.append((url, reason))
+
+    def take_pending(self):
+        pending, self.pending = self.pending, 0
+        return pending
+
 class CustomWebEnginePage(QWebEnginePage):
-    def __init__(self, parent_window, whitelist, blacklist):
-        super().__init__(parent_window)
+    def __init__(self, profile, parent_window, filter_stats, log_suppressor, url_filter=None):
+        super().__init__(profile, parent_window)
         self.parent_window = parent_window
-        self.whitelist = whitelist
-        self.blacklist = blacklist
+        # Shared by every tab, so the decision cache and log counters cover the whole window
+        self.filter_stats = filter_stats
+        self.log_suppressor = log_suppressor
+        self.url_filter = url_filter # None until the lists have loaded; everything is blocked until then
+
+    def set_filter(self, url_filter):
+        # A fresh filter is swapped in with one assignment, so decisions cached against
+        # the old lists are dropped together with them
+        self.url_filter = url_filter
 
     def acceptNavigationRequest(self, url, _type, isMainFrame):
+        if url.scheme() == BLOCKED_PAGE_SCHEME:
+            return True # Our local "blocked" page; web content cannot open this scheme
         url_str = url.toString()
-        url_str_lower = url_str.lower()
+        url_filter = self.url_filter
+        if url_filter is None:
+            log_event("NAVIGATION_BLOCKED", f"Lists not loaded yet: {url_str}")
+            return False
+        key = url_filter.cache_key(url_str)
         
-        log_event("NAVIGATION_REQUEST", f"URL: {url_str}, Type: {_type}, MainFrame: {isMainFrame}")
+        self.log_suppressor.log("NAVIGATION_REQUEST", key,
+                                f"URL: {url_str}, Type: {_type}, MainFrame: {isMainFrame}")
+
+        allowed, reason, matched = url_filter.decide(url_str)
+        if reason == "blacklisted":
+            self.log_suppressor.log("NAVIGATION_BLOCKED", key, f"Blacklisted ({matched}): {url_str}")
+            self.report_blocked(url_str, "URL is blacklisted.", isMainFrame)
+        elif reason == "whitelisted":
+            self.log_suppressor.log("NAVIGATION_ALLOWED", key, f"Whitelisted ({matched}): {url_str}")
+        elif reason == "not_whitelisted":
+            self.log_suppressor.log("NAVIGATION_BLOCKED", key, f"Not in whitelist (active): {url_str}")
+            self.report_blocked(url_str, "URL not in whitelist.", isMainFrame)
+        else:
+            self.log_suppressor.log("NAVIGATION_ALLOWED", key,
+                                    f"Default (no active whitelist, not blacklisted): {url_str}")
+        return allowed
+
+    def report_blocked(self, url_str, reason, isMainFrame):
+        # Nothing here may block: subframes and redirects are only counted, and a blocked
+        # main-frame load is replaced with a local page once this request has been answered
+        self.parent_window.blocked_counter.record(url_str, reason)
+        if isMainFrame:
+            QMetaObject.invokeMethod(self, "show_blocked_page", Qt.QueuedConnection,
+                                     Q_ARG(str, url_str), Q_ARG(str, reason))
+
+    @pyqtSlot(str, str)
+    def show_blocked_page(self, url, reason):
+        self.setUrl(self.parent_window.blocked_pages.page_url(url, reason))
+
+    def createWindow(self, _type):
+        # target=_blank links and window.open() get a tab; what loads in it is filtered like any other page
+        view = self.parent_window.add_tab(background=_type == QWebEnginePage.WebBrowserBackgroundTab)
+        return view.page()
+
+# --- Persistent Profile and Cache ---
+def create_profile(parent=None):
+    """The on-disk profile shared by every page: persistent cookies and a size-capped HTTP disk cache."""
+    profile = QWebEngineProfile(PROFILE_NAME, parent)
+    profile.setPersistentStoragePath(os.path.abspath(PROFILE_STORAGE_PATH))
+    profile.setCachePath(os.path.abspath(PROFILE_CACHE_PATH))
+    profile.setHttpCacheType(QWebEngineProfile.DiskHttpCache)
+    profile.setHttpCacheMaximumSize(PROFILE_CACHE_MAX_BYTES)
+    profile.setPersistentCookiesPolicy(QWebEngineProfile.ForcePersistentCookies)
+    log_event("PROFILE", f"Using profile '{PROFILE_NAME}': storage {profile.persistentStoragePath()}, "
+                         f"cache {profile.cachePath()} (max {PROFILE_CACHE_MAX_BYTES} bytes).")
+    return profile
 
-        if any(b_url in url_str_lower for b_url in self.blacklist):
-            log_event("NAVIGATION_BLOCKED", f"Blacklisted: {url_str}")
-            QMetaObject.invokeMethod(self.parent_window, "show_blocked_message_slot", Qt.QueuedConnection,
-                                     Q_ARG(str, url_str), Q_ARG(str, "URL is blacklisted."))
-            return False
 
-        if self.whitelist:
-            if any(w_url in url_str_lower for w_url in self.whitelist):
-                log_event("NAVIGATION_ALLOWED", f"Whitelisted: {url_str}")
-                return True
+def directory_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass # Cache entries come and go while we walk
+    return total
+
+
+class CacheStats:
+    """HTTP cache hits, counted from each loaded page's Resource Timing entries.
+
+    A resource with a body but a transferSize of 0 was served from the cache.
+    Cross-origin resources without Timing-Allow-Origin report 0 for both and are
+    counted as unknown rather than guessed at.
+    """
+
+    SCRIPT = ("performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'))"
+              ".map(function (e) { return [e.transferSize, e.decodedBodySize]; })")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.resources = 0
+        self.cached = 0
+        self.unknown = 0
+        self.transferred_bytes = 0
+
+    def add_entries(self, entries):
+        for transfer_size, body_size in entries or ():
+            self.resources += 1
+            if not transfer_size and not body_size:
+                self.unknown += 1
+            elif not transfer_size:
+                self.cached += 1
             else:
-                log_event("NAVIGATION_BLOCKED", f"Not in whitelist (active): {url_str}")
-                QMetaObject.invokeMethod(self.parent_window, "show_blocked_message_slot", Qt.QueuedConnection,
-                                     Q_ARG(str, url_str), Q_ARG(str, "URL not in whitelist."))
-                return False
-        
-        log_event("NAVIGATION_ALLOWED", f"Default (no active whitelist, not blacklisted): {url_str}")
-        return True
+                self.transferred_bytes += int(transfer_size)
+
+    @property
+    def hit_rate(self):
+        known = self.resources - self.unknown
+        return self.cached / known if known else 0.0
+
+
+class PreloadPage(QWebEnginePage):
+    """Hidden page that loads PRELOAD_URLS one after another to warm the shared cache."""
+
+    def __init__(self, profile, parent_window, urls):
+        super().__init__(profile, parent_window)
+        self.parent_window = parent_window
+        self.pending = list(urls)
+        self.loadFinished.connect(self.load_next)
+
+    def load_next(self, success=True):
+        while self.pending:
+            url = self.pending.pop(0)
+            allowed, reason, _matched = self.parent_window.url_filter.decide(url)
+            if allowed:
+                log_event("PRELOAD", f"Preloading {url}")
+                self.setUrl(QUrl(url))
+                return
+            log_event("PRELOAD", f"Skipped {url} ({reason})")
+        log_event("PRELOAD", "Preload finished.")
+
+    def acceptNavigationRequest(self, url, _type, isMainFrame):
+        # Redirects are held to the same lists as the main page, without the blocked page or counter
+        return self.parent_window.url_filter.decide(url.toString())[0]
+
+# --- Tab Lifecycle ---
+# Frozen/Discarded page states need Qt 5.14; on older versions hidden tabs simply stay live
+LIFECYCLE_SUPPORTED = hasattr(QWebEnginePage, "LifecycleState")
+
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo, or None where that isn't available."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (IOError, ValueError):
+        pass
+    return None
 
 # --- URL List Management Dialog ---
 class UrlListDialog(QDialog):
-    def __init__(self, current_urls, dialog_title, parent=None):
+    """Edits one list in the store a page at a time; OK commits the edits, Cancel rolls them back."""
+
+    def __init__(self, store, list_name, dialog_title, parent=None):
         super().__init__(parent)
         self.setWindowTitle(dialog_title)
         self.setMinimumSize(500, 400) # Slightly larger for better spacing
         self.urls_modified = False
+        self.store = store
+        self.list_name = list_name
+        self.offset = 0
+        self.store.begin()
 
         self.layout = QVBoxLayout(self)
         self.layout.setSpacing(10) # Add some spacing between widgets
@@ -214,34 +665,59 @@ class UrlListDialog(QDialog):
         self.info_label = QLabel("Enter domain (e.g., example.com) or full URL.\nMatching is case-insensitive and checks for substrings.")
         self.layout.addWidget(self.info_label)
 
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter entries...")
+        self.filter_timer = QTimer(self) # Re-query once typing pauses, not on every keystroke
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.filter_input.textChanged.connect(self.filter_timer.start)
+        self.layout.addWidget(self.filter_input)
+
         self.list_widget = QListWidget()
-        if current_urls:
-            self.list_widget.addItems(current_urls)
+        self.list_widget.setSelectionMode(QListWidget.ExtendedSelection)
         self.layout.addWidget(self.list_widget)
 
+        page_layout = QHBoxLayout()
+        self.prev_button = QPushButton("Previous")
+        self.prev_button.clicked.connect(lambda: self.show_page(self.offset - LIST_PAGE_SIZE))
+        self.next_button = QPushButton("Next")
+        self.next_button.clicked.connect(lambda: self.show_page(self.offset + LIST_PAGE_SIZE))
+        self.page_label = QLabel()
+        page_layout.addWidget(self.prev_button)
+        page_layout.addWidget(self.page_label, 1, Qt.AlignCenter)
+        page_layout.addWidget(self.next_button)
+        self.layout.addLayout(page_layout)
+
         input_area_layout = QHBoxLayout()
         self.url_input = QLineEdit()
         self.url_input.setPlaceholderText("e.g., imaginea.store or https://specific.page.com")
         self.add_button = QPushButton("Add")
-        if os.path.exists(ICON_ADD):
-            self.add_button.setIcon(QIcon(ICON_ADD))
-        else: # Fallback if icon is missing
-            self.add_button.setIcon(self.style().standardIcon(QStyle.SP_DialogApplyButton))
-            print(f"Warning: Icon not found at {ICON_ADD}")
+        icon = find_icon(ICON_ADD)
+        if icon is None: # Fallback if icon is missing
+            icon = self.style().standardIcon(QStyle.SP_DialogApplyButton)
+        self.add_button.setIcon(icon)
         self.add_button.clicked.connect(self.add_url)
         input_area_layout.addWidget(self.url_input)
         input_area_layout.addWidget(self.add_button)
         self.layout.addLayout(input_area_layout)
 
+        actions_layout = QHBoxLayout()
+        self.import_button = QPushButton("Import List...")
+        self.import_button.setToolTip("Add entries from a plain list, hosts file or adblock filter list")
+        self.import_button.clicked.connect(self.import_list)
+        actions_layout.addWidget(self.import_button)
+        actions_layout.addStretch(1)
+
         self.remove_button = QPushButton("Remove Selected")
-        if os.path.exists(ICON_REMOVE):
-            self.remove_button.setIcon(QIcon(ICON_REMOVE))
-        else: # Fallback
-            self.remove_button.setIcon(self.style().standardIcon(QStyle.SP_DialogCancelButton))
-            print(f"Warning: Icon not found at {ICON_REMOVE}")
+        icon = find_icon(ICON_REMOVE)
+        if icon is None: # Fallback
+            icon = self.style().standardIcon(QStyle.SP_DialogCancelButton)
+        self.remove_button.setIcon(icon)
 
         self.remove_button.clicked.connect(self.remove_url)
-        self.layout.addWidget(self.remove_button, 0, Qt.AlignRight) # Align to right
+        actions_layout.addWidget(self.remove_button)
+        self.layout.addLayout(actions_layout)
 
         self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         # Style standard buttons if needed (QSS above might cover them)
@@ -251,38 +727,72 @@ class UrlListDialog(QDialog):
         self.button_box.rejected.connect(self.reject)
         self.layout.addWidget(self.button_box)
 
+        self.show_page(0)
+
+    def apply_filter(self):
+        self.show_page(0)
+
+    def show_page(self, offset):
+        filter_text = self.filter_input.text().strip()
+        total = self.store.count(self.list_name, filter_text)
+        self.offset = max(0, min(offset, (total - 1) // LIST_PAGE_SIZE * LIST_PAGE_SIZE if total else 0))
+        self.list_widget.clear()
+        self.list_widget.addItems(self.store.page(self.list_name, filter_text, self.offset, LIST_PAGE_SIZE))
+        shown_to = min(self.offset + LIST_PAGE_SIZE, total)
+        self.page_label.setText(f"{self.offset + 1 if total else 0}-{shown_to} of {total}")
+        self.prev_button.setEnabled(self.offset > 0)
+        self.next_button.setEnabled(shown_to < total)
+
     def add_url(self):
         url = self.url_input.text().strip().lower()
         if not url:
             QMessageBox.warning(self, "Input Error", "URL cannot be empty.")
             return
         
-        items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
-        if url in items:
+        if self.store.contains(self.list_name, url):
             QMessageBox.information(self, "Duplicate", "This URL is already in the list.")
             return
             
-        self.list_widget.addItem(url)
+        self.store.add(self.list_name, [url])
         self.url_input.clear()
         self.urls_modified = True
+        self.show_page(self.offset)
 
     def remove_url(self):
         selected_items = self.list_widget.selectedItems()
         if not selected_items:
             QMessageBox.warning(self, "Selection Error", "Please select a URL to remove.")
             return
-        for item in selected_items:
-            self.list_widget.takeItem(self.list_widget.row(item))
+        self.store.remove(self.list_name, [item.text() for item in selected_items])
         self.urls_modified = True
+        self.show_page(self.offset)
 
-    def get_urls(self):
-        return sorted([self.list_widget.item(i).text() for i in range(self.list_widget.count())])
+    def import_list(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Import List", "",
+                                                  "Lists (*.txt *.hosts *.list);;All Files (*)")
+        if not filename:
+            return
+        try:
+            added = self.store.import_file(self.list_name, filename)
+        except (IOError, OSError) as e:
+            QMessageBox.critical(self, "Import Error", f"Could not import {filename}:\n{e}")
+            return
+        log_event("URL_LIST_IMPORT", f"Imported {added} new entries into {self.list_name} from {filename}.")
+        if added:
+            self.urls_modified = True
+        QMessageBox.information(self, "Import Finished", f"Added {added} new entries.")
+        self.show_page(0)
 
     def accept(self):
+        self.store.commit()
         if self.urls_modified:
             log_event("URL_LIST_DIALOG", f"{self.windowTitle()} modified and OK'd.")
         super().accept()
 
+    def reject(self):
+        self.store.rollback()
+        super().reject()
+
 # --- Main Window ---
 class MainWindow(QMainWindow):
     def __init__(self, *args, **kwargs):
@@ -290,57 +800,285 @@ class MainWindow(QMainWindow):
         
         log_event("APP_LIFECYCLE", "Application starting...")
 
-        self.whitelist = self.load_list_from_file(WHITELIST_FILE, "Whitelist")
-        self.blacklist = self.load_list_from_file(BLACKLIST_FILE, "Blacklist")
-
-        default_home_url_lower = DEFAULT_HOME_URL.lower()
-        is_blacklisted = any(b_url in default_home_url_lower for b_url in self.blacklist)
-        is_whitelisted = any(w_url in default_home_url_lower for w_url in self.whitelist)
-
-        if not is_blacklisted and not is_whitelisted:
-            self.whitelist.append(default_home_url_lower)
-            self.whitelist.sort()
-            self.save_list_to_file(WHITELIST_FILE, self.whitelist, "Whitelist")
-            log_event("WHITELIST_AUTO_ADD", f"Ensured {DEFAULT_HOME_URL} is in whitelist.")
-
-        self.browser = QWebEngineView()
-        self.custom_page = CustomWebEnginePage(self, self.whitelist, self.blacklist)
-        self.browser.setPage(self.custom_page)
-        
-        self.browser.setUrl(QUrl(DEFAULT_HOME_URL))
-        self.browser.urlChanged.connect(self.update_urlbar)
-        self.browser.loadFinished.connect(self.update_title)
-        self.browser.loadStarted.connect(lambda: log_event("BROWSER_EVENT", "Page load started."))
-        self.browser.loadFinished.connect(lambda success: log_event("BROWSER_EVENT", f"Page load finished (Success: {success})."))
+        # Only what the first paint needs happens here. The lists are loaded and compiled
+        # on a worker thread, and the web view is created once the window has been painted
+        self._list_store = None # Opened on first use by the list dialogs
+        self.whitelist = []
+        self.blacklist = []
+        self.filter_stats = FilterStats()
+        self.log_suppressor = LogSuppressor(LOG_SUPPRESS_WINDOW)
+        self.url_filter = None # Shared by all tabs' pages
+        self.loaded_filter = None
+        self.tabs = None
+        self.tab_last_used = {} # view -> time.monotonic() it was last the current tab
+        self.previous_tab = None
+        self.first_paint_seen = False
+        self.deferred_actions = [] # Enabled once the page is up with its lists
+        threading.Thread(target=self.load_lists, name="list-loader", daemon=True).start()
 
-        self.setCentralWidget(self.browser)
+        self.loading_label = QLabel("Loading...")
+        self.loading_label.setAlignment(Qt.AlignCenter)
+        self.setCentralWidget(self.loading_label)
         self.status = QStatusBar()
         self.setStatusBar(self.status)
+        self.blocked_counter = BlockedCounter(BLOCKED_RECENT_COUNT)
+        self.blocked_label = QLabel()
+        self.status.addPermanentWidget(self.blocked_label)
+        self.blocked_timer = QTimer(self)
+        self.blocked_timer.timeout.connect(self.update_blocked_status)
+        self.filter_stats_label = QLabel()
+        self.status.addPermanentWidget(self.filter_stats_label)
+        self.filter_stats_timer = QTimer(self)
+        self.filter_stats_timer.timeout.connect(self.update_filter_stats)
+        self.profile = None
+        self.blocked_pages = None
+        self.cache_stats = CacheStats()
+        self.preload_page = None
+        self.preload_timer = QTimer(self)
+        self.preload_timer.setSingleShot(True)
+        self.preload_timer.setInterval(PRELOAD_IDLE_MS)
+        self.preload_timer.timeout.connect(self.start_preload)
+        self.tab_limit_timer = QTimer(self)
+        self.tab_limit_timer.timeout.connect(self.enforce_tab_limits)
 
         self.setup_toolbar()
         self.setup_menus()
+        for action in self.deferred_actions:
+            action.setEnabled(False)
+        self.urlbar.setEnabled(False)
         
         self.setWindowTitle(APP_NAME)
-        if os.path.exists(APP_ICON_PATH):
-            self.setWindowIcon(QIcon(APP_ICON_PATH))
-        else:
-            print(f"Warning: App icon not found at {APP_ICON_PATH}")
-
+        icon = find_icon(APP_ICON_PATH)
+        if icon is not None:
+            self.setWindowIcon(icon)
 
         self.showMaximized()
+        QTimer.singleShot(WEBENGINE_INIT_FALLBACK_MS, self.init_browser)
+        startup_profile.mark("window_shown")
         log_event("APP_LIFECYCLE", "Main window initialized and shown.")
 
-    def _create_action(self, icon_path, text, tip, callback):
-        """Helper to create QAction with icon and fallback."""
-        action = QAction(text, self)
-        if os.path.exists(icon_path):
-            action.setIcon(QIcon(icon_path))
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_seen:
+            self.first_paint_seen = True
+            startup_profile.mark("first_paint")
+            QTimer.singleShot(0, self.init_browser) # Let the paint reach the screen first
+
+    @property
+    def browser(self):
+        """The current tab's view, or None before the web view has been created."""
+        return self.tabs.currentWidget() if self.tabs is not None else None
+
+    def init_browser(self):
+        """Create the tab widget and first tab (and with them the WebEngine profile and render process)."""
+        if self.tabs is not None:
+            return
+        self.profile = create_profile(QApplication.instance()) # Outlives the window's pages
+        self.blocked_pages = BlockedPageHandler(self.profile)
+        self.profile.installUrlSchemeHandler(BLOCKED_PAGE_SCHEME.encode(), self.blocked_pages)
+        self.tabs = QTabWidget()
+        self.tabs.setDocumentMode(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setElideMode(Qt.ElideRight)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.current_tab_changed)
+        view = self.add_tab()
+        view.loadFinished.connect(self.on_first_load_finished)
+
+        self.setCentralWidget(self.tabs)
+        self.loading_label = None
+        self.filter_stats_timer.start(FILTER_STATS_INTERVAL_MS)
+        self.blocked_timer.start(BLOCKED_STATUS_INTERVAL_MS)
+        if LIFECYCLE_SUPPORTED:
+            self.tab_limit_timer.start(TAB_MEMORY_CHECK_INTERVAL_MS)
+        startup_profile.mark("webengine_ready")
+        self.load_home_when_ready()
+
+    def add_tab(self, url=None, background=False):
+        view = QWebEngineView()
+        page = CustomWebEnginePage(self.profile, self, self.filter_stats, self.log_suppressor, self.url_filter)
+        view.setPage(page)
+        
+        view.urlChanged.connect(lambda q: self.update_urlbar(q, view))
+        view.titleChanged.connect(lambda _title: self.update_title(view))
+        view.loadStarted.connect(lambda: log_event("BROWSER_EVENT", "Page load started."))
+        view.loadFinished.connect(lambda success: log_event("BROWSER_EVENT", f"Page load finished (Success: {success})."))
+        view.loadFinished.connect(lambda success: self.collect_cache_stats(page, success))
+        # Any page load postpones preloading (lambdas, so loadFinished's bool isn't taken as an interval)
+        view.loadStarted.connect(lambda: self.preload_timer.start())
+        view.loadFinished.connect(lambda _success: self.preload_timer.start())
+
+        self.tab_last_used[view] = time.monotonic()
+        index = self.tabs.addTab(view, "New Tab")
+        if url is not None:
+            view.setUrl(QUrl(url))
+        if background:
+            self.schedule_freeze(view)
         else:
-            print(f"Warning: Icon not found at {icon_path} for action '{text}'")
-            # You could add a fallback to QStyle.standardIcon here if desired
-            # e.g., action.setIcon(self.style().standardIcon(QStyle.SP_QuestionMark))
+            self.tabs.setCurrentIndex(index)
+        log_event("TAB_OPENED", f"Tab opened{' in the background' if background else ''}. Tabs: {self.tabs.count()}")
+        self.enforce_tab_limits()
+        return view
+
+    def new_tab(self):
+        self.add_tab(DEFAULT_HOME_URL)
+
+    def close_tab(self, index):
+        view = self.tabs.widget(index)
+        if self.tabs.count() == 1: # The kiosk always keeps a tab; closing the last one goes home instead
+            view.setUrl(QUrl(DEFAULT_HOME_URL))
+            return
+        self.tab_last_used.pop(view, None)
+        if self.previous_tab is view:
+            self.previous_tab = None
+        self.tabs.removeTab(index)
+        page = view.page()
+        page.deleteLater() # Owned by the window, not the view
+        view.deleteLater()
+        log_event("TAB_CLOSED", f"Tab closed. Tabs: {self.tabs.count()}")
+
+    def close_current_tab(self):
+        self.close_tab(self.tabs.currentIndex())
+
+    def current_tab_changed(self, index):
+        view = self.tabs.widget(index)
+        if self.previous_tab is not None and self.previous_tab is not view:
+            self.schedule_freeze(self.previous_tab)
+        self.previous_tab = view
+        if view is None:
+            return
+        self.tab_last_used[view] = time.monotonic()
+        if LIFECYCLE_SUPPORTED and view.page().lifecycleState() != QWebEnginePage.LifecycleState.Active:
+            # A discarded tab reloads its last URL here; a frozen one just resumes
+            log_event("TAB_RESTORED", f"Restoring {view.page().lifecycleState().name} tab: {view.url().toString()}")
+            view.page().setLifecycleState(QWebEnginePage.LifecycleState.Active)
+            self.tabs.setTabToolTip(index, view.title())
+        self.update_urlbar(view.url(), view)
+        self.update_title(view)
+
+    def schedule_freeze(self, view):
+        if LIFECYCLE_SUPPORTED and TAB_FREEZE_DELAY_MS >= 0:
+            QTimer.singleShot(TAB_FREEZE_DELAY_MS, lambda: self.freeze_tab(view))
+
+    def freeze_tab(self, view):
+        # The tab may have been closed or brought back to the front since this was scheduled
+        if view not in self.tab_last_used or view is self.browser:
+            return
+        page = view.page()
+        if page.lifecycleState() != QWebEnginePage.LifecycleState.Active:
+            return
+        if page.recommendedState() == QWebEnginePage.LifecycleState.Active:
+            return # e.g. playing audio; WebEngine advises against freezing it
+        page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+        log_event("TAB_FROZEN", f"Hidden tab frozen: {view.url().toString()}")
+
+    def enforce_tab_limits(self):
+        """Discard least recently used hidden tabs beyond MAX_LIVE_TABS, or one when memory runs low."""
+        if not LIFECYCLE_SUPPORTED or self.tabs is None:
+            return
+        current = self.browser
+        hidden = sorted((view for view in self.tab_last_used
+                         if view is not current
+                         and view.page().lifecycleState() != QWebEnginePage.LifecycleState.Discarded),
+                        key=self.tab_last_used.get)
+        excess = len(hidden) + 1 - MAX_LIVE_TABS if MAX_LIVE_TABS > 0 else 0
+        reason = f"over {MAX_LIVE_TABS} live tabs"
+        if excess <= 0 and TAB_MIN_AVAILABLE_MB > 0:
+            available = available_memory_mb()
+            if available is not None and available < TAB_MIN_AVAILABLE_MB:
+                # One per check, so the freed memory shows up before deciding on the next
+                excess, reason = 1, f"{available} MB available"
+        for view in hidden:
+            if excess <= 0:
+                break
+            if view.page().recommendedState() == QWebEnginePage.LifecycleState.Active:
+                continue
+            view.page().setLifecycleState(QWebEnginePage.LifecycleState.Discarded)
+            self.tabs.setTabToolTip(self.tabs.indexOf(view), f"{view.title()} (unloaded, reloads when opened)")
+            log_event("TAB_DISCARDED", f"Discarded hidden tab ({reason}): {view.url().toString()}")
+            excess -= 1
+
+    def apply_filter(self, url_filter):
+        self.url_filter = url_filter
+        for view in self.tab_last_used:
+            view.page().set_filter(url_filter)
+
+    def load_lists(self):
+        """Runs on the list-loader thread: read (and on first run migrate) both lists and compile the filter."""
+        result = {"whitelist": [], "blacklist": [], "filter": None, "error": None}
+        try:
+            store = UrlListStore(LIST_DB_FILE) # SQLite connections stay on the thread that opened them
+            try:
+                whitelist = self.load_list(store, "whitelist", WHITELIST_FILE, "Whitelist")
+                blacklist = self.load_list(store, "blacklist", BLACKLIST_FILE, "Blacklist")
+
+                default_home_url_lower = DEFAULT_HOME_URL.lower()
+                url_filter = UrlFilter(whitelist, blacklist, NAV_DECISION_CACHE_SIZE, self.filter_stats)
+                is_blacklisted = url_filter.blacklist_matcher.matches(default_home_url_lower)
+                is_whitelisted = url_filter.whitelist_matcher.matches(default_home_url_lower)
+
+                if not is_blacklisted and not is_whitelisted:
+                    store.add("whitelist", [default_home_url_lower])
+                    whitelist = store.urls("whitelist")
+                    url_filter = UrlFilter(whitelist, blacklist, NAV_DECISION_CACHE_SIZE, self.filter_stats)
+                    log_event("WHITELIST_AUTO_ADD", f"Ensured {DEFAULT_HOME_URL} is in whitelist.")
+            finally:
+                store.close()
+            result.update(whitelist=whitelist, blacklist=blacklist, filter=url_filter)
+            startup_profile.mark("lists_loaded")
+        except Exception as e: # Anything, including a badly encoded list file: the window must still hear back
+            log_event("FILE_ERROR", f"Error loading URL lists: {e}")
+            result["error"] = str(e)
+        QMetaObject.invokeMethod(self, "lists_loaded_slot", Qt.QueuedConnection, Q_ARG(object, result))
+
+    @pyqtSlot(object)
+    def lists_loaded_slot(self, result):
+        if result["error"] is not None:
+            # Fail closed: without the real lists only the home page may be visited
+            QMessageBox.warning(self, "File Error", f"Could not load the URL lists:\n{result['error']}\n\n"
+                                                    "Only the home page is allowed.")
+            result.update(whitelist=[DEFAULT_HOME_URL.lower()], blacklist=[],
+                          filter=UrlFilter([DEFAULT_HOME_URL.lower()], [], NAV_DECISION_CACHE_SIZE, self.filter_stats))
+        self.whitelist = result["whitelist"]
+        self.blacklist = result["blacklist"]
+        self.loaded_filter = result["filter"]
+        self.load_home_when_ready()
+
+    def load_home_when_ready(self):
+        """Navigate home once both the web view and the lists are ready, whichever finishes last."""
+        if self.tabs is None or self.loaded_filter is None:
+            return
+        self.apply_filter(self.loaded_filter)
+        self.loaded_filter = None
+        for action in self.deferred_actions:
+            action.setEnabled(True)
+        self.urlbar.setEnabled(True)
+        self.browser.setUrl(QUrl(DEFAULT_HOME_URL))
+
+    def on_first_load_finished(self, success):
+        self.sender().loadFinished.disconnect(self.on_first_load_finished)
+        startup_profile.mark("home_loaded" if success else "home_load_failed")
+        startup_profile.report()
+
+    @property
+    def list_store(self):
+        if self._list_store is None:
+            self._list_store = UrlListStore(LIST_DB_FILE)
+        return self._list_store
+
+    def _create_action(self, icon_path, text, tip, callback, deferred=False):
+        """Helper to create QAction with icon and fallback; deferred actions wait for the page and lists."""
+        action = QAction(text, self)
+        icon = find_icon(icon_path)
+        if icon is not None:
+            action.setIcon(icon)
+        # You could add a fallback to QStyle.standardIcon here if desired
+        # e.g., action.setIcon(self.style().standardIcon(QStyle.SP_QuestionMark))
         action.setStatusTip(tip)
         action.triggered.connect(lambda: self.log_and_execute(text, callback))
+        if deferred:
+            self.deferred_actions.append(action)
         return action
 
     def setup_toolbar(self):
@@ -350,16 +1088,20 @@ class MainWindow(QMainWindow):
         navtb.setFloatable(False)
         self.addToolBar(navtb)
 
-        back_btn = self._create_action(ICON_BACK, "Back", "Back to previous page", self.browser.back)
+        new_tab_btn = self._create_action(ICON_NEW_TAB, "New Tab", f"Open {DEFAULT_HOME_URL} in a new tab", self.new_tab, deferred=True)
+        new_tab_btn.setShortcut(QKeySequence.AddTab)
+        navtb.addAction(new_tab_btn)
+
+        back_btn = self._create_action(ICON_BACK, "Back", "Back to previous page", lambda: self.browser.back(), deferred=True)
         navtb.addAction(back_btn)
 
-        next_btn = self._create_action(ICON_FORWARD, "Forward", "Forward to next page", self.browser.forward)
+        next_btn = self._create_action(ICON_FORWARD, "Forward", "Forward to next page", lambda: self.browser.forward(), deferred=True)
         navtb.addAction(next_btn)
 
-        reload_btn = self._create_action(ICON_RELOAD, "Reload", "Reload page", self.browser.reload)
+        reload_btn = self._create_action(ICON_RELOAD, "Reload", "Reload page", lambda: self.browser.reload(), deferred=True)
         navtb.addAction(reload_btn)
 
-        home_btn = self._create_action(ICON_HOME, "Home", f"Go to Home Page ({DEFAULT_HOME_URL})", self.navigate_home)
+        home_btn = self._create_action(ICON_HOME, "Home", f"Go to Home Page ({DEFAULT_HOME_URL})", self.navigate_home, deferred=True)
         navtb.addAction(home_btn)
 
         navtb.addSeparator()
@@ -368,31 +1110,75 @@ class MainWindow(QMainWindow):
         self.urlbar.returnPressed.connect(self.navigate_to_url)
         navtb.addWidget(self.urlbar)
 
-        stop_btn = self._create_action(ICON_STOP, "Stop", "Stop loading current page", self.browser.stop)
+        stop_btn = self._create_action(ICON_STOP, "Stop", "Stop loading current page", lambda: self.browser.stop(), deferred=True)
         navtb.addAction(stop_btn)
 
     def setup_menus(self):
         menubar = self.menuBar()
         
         file_menu = menubar.addMenu("&File")
+        close_tab_action = self._create_action(ICON_CLOSE_TAB, "&Close Tab", "Close the current tab", self.close_current_tab, deferred=True)
+        close_tab_action.setShortcut(QKeySequence.Close)
+        file_menu.addAction(close_tab_action)
         exit_action = self._create_action(ICON_EXIT, "E&xit", "Exit application", self.close)
         file_menu.addAction(exit_action)
 
         settings_menu = menubar.addMenu("&Settings")
         
-        manage_whitelist_action = self._create_action(ICON_WHITELIST, "Manage &Whitelist", "Add or remove URLs from the whitelist", self.manage_whitelist)
+        manage_whitelist_action = self._create_action(ICON_WHITELIST, "Manage &Whitelist", "Add or remove URLs from the whitelist", self.manage_whitelist, deferred=True)
         settings_menu.addAction(manage_whitelist_action)
 
-        manage_blacklist_action = self._create_action(ICON_BLACKLIST, "Manage &Blacklist", "Add or remove URLs from the blacklist", self.manage_blacklist)
+        manage_blacklist_action = self._create_action(ICON_BLACKLIST, "Manage &Blacklist", "Add or remove URLs from the blacklist", self.manage_blacklist, deferred=True)
         settings_menu.addAction(manage_blacklist_action)
 
+        settings_menu.addSeparator()
+        cache_stats_action = self._create_action(ICON_CACHE, "&Cache Statistics...", "Show HTTP cache hit rate and size, or clear the cache", self.show_cache_stats, deferred=True)
+        settings_menu.addAction(cache_stats_action)
+
     def log_and_execute(self, action_name, function_to_call):
         log_event("BUTTON_CLICK", f"{action_name} clicked.")
         function_to_call()
 
-    def update_title(self):
-        title = self.browser.page().title()
-        self.setWindowTitle(f"{title} - {APP_NAME}")
+    def update_title(self, view):
+        title = view.page().title()
+        index = self.tabs.indexOf(view)
+        if index != -1:
+            self.tabs.setTabText(index, title or "New Tab")
+            self.tabs.setTabToolTip(index, title)
+        if view is self.browser:
+            self.setWindowTitle(f"{title} - {APP_NAME}")
+
+    def collect_cache_stats(self, page, success):
+        if success:
+            page.runJavaScript(CacheStats.SCRIPT, self.cache_stats.add_entries)
+
+    def start_preload(self):
+        if not PRELOAD_URLS or self.preload_page is not None or self.url_filter is None:
+            return
+        self.preload_page = PreloadPage(self.profile, self, PRELOAD_URLS)
+        self.preload_page.load_next()
+
+    def show_cache_stats(self):
+        stats = self.cache_stats
+        cache_bytes = directory_size(self.profile.cachePath())
+        summary = (f"Cache hits: {stats.cached} of {stats.resources - stats.unknown} resources ({stats.hit_rate:.0%})\n"
+                   f"Not measurable (cross-origin): {stats.unknown}\n"
+                   f"Downloaded: {stats.transferred_bytes / 1e6:.1f} MB\n"
+                   f"Disk cache: {cache_bytes / 1e6:.1f} MB of {PROFILE_CACHE_MAX_BYTES / 1e6:.0f} MB\n"
+                   f"Location: {self.profile.cachePath()}")
+        log_event("CACHE_STATS", summary.replace("\n", "; "))
+
+        msg_box = QMessageBox(self)
+        msg_box.setIcon(QMessageBox.Information)
+        msg_box.setWindowTitle("Cache Statistics")
+        msg_box.setText(summary)
+        clear_button = msg_box.addButton("Clear Cache", QMessageBox.DestructiveRole)
+        msg_box.addButton(QMessageBox.Close)
+        msg_box.exec_()
+        if msg_box.clickedButton() is clear_button:
+            self.profile.clearHttpCache()
+            stats.reset()
+            log_event("CACHE_CLEARED", f"HTTP cache cleared ({cache_bytes} bytes on disk).")
 
     def navigate_home(self):
         self.browser.setUrl(QUrl(DEFAULT_HOME_URL))
@@ -404,71 +1190,69 @@ class MainWindow(QMainWindow):
         log_event("NAVIGATION_INTENT", f"URL bar navigation to: {q.toString()}")
         self.browser.setUrl(q)
 
-    def update_urlbar(self, q):
+    def update_filter_stats(self):
+        """Refresh the status bar's filter cache figures and write out expired log counters."""
+        self.log_suppressor.flush()
+        if self.url_filter is None:
+            return
+        stats = self.filter_stats
+        self.filter_stats_label.setText(f"Filter cache: {stats.hit_rate:.0%} hits")
+        self.filter_stats_label.setToolTip(
+            f"Navigation decisions: {stats.lookups} ({stats.hits} cached, {stats.misses} evaluated)\n"
+            f"Cached URLs: {len(self.url_filter)} of {NAV_DECISION_CACHE_SIZE}\n"
+            f"Repeated log lines collapsed: {self.log_suppressor.suppressed}")
+
+    def update_urlbar(self, q, view):
+        if view is not self.browser:
+            return # Background tabs don't touch the URL bar
         self.urlbar.setText(q.toString())
         self.urlbar.setCursorPosition(0)
         log_event("URL_CHANGED", f"Browser URL changed to: {q.toString()}")
         
-    def load_list_from_file(self, filename, list_name):
-        urls = []
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r", encoding="utf-8") as f:
-                    urls = sorted([line.strip().lower() for line in f if line.strip()])
-                log_event("FILE_IO", f"Loaded {len(urls)} URLs from {list_name} ({filename}).")
-            except IOError as e:
-                log_event("FILE_ERROR", f"Error loading {list_name} from {filename}: {e}")
-                QMessageBox.warning(self, "File Error", f"Could not load {list_name} from {filename}:\n{e}")
-        else:
-            log_event("FILE_IO", f"{list_name} file ({filename}) not found. Starting with empty list.")
+    def load_list(self, store, name, legacy_filename, list_name):
+        migrated = store.migrate_text_file(name, legacy_filename)
+        if migrated is not None:
+            log_event("FILE_IO", f"Migrated {migrated} URLs for {list_name} from {legacy_filename} to {LIST_DB_FILE}.")
+        urls = store.urls(name)
+        log_event("FILE_IO", f"Loaded {len(urls)} URLs from {list_name} ({LIST_DB_FILE}).")
         return urls
 
-    def save_list_to_file(self, filename, url_list, list_name):
-        try:
-            with open(filename, "w", encoding="utf-8") as f:
-                for url_entry in sorted(url_list):
-                    f.write(url_entry + "\n")
-            log_event("FILE_IO", f"Saved {len(url_list)} URLs to {list_name} ({filename}).")
-        except IOError as e:
-            log_event("FILE_ERROR", f"Error saving {list_name} to {filename}: {e}")
-            QMessageBox.critical(self, "File Error", f"Could not save {list_name} to {filename}:\n{e}")
+    def manage_list(self, name, list_name):
+        dialog = UrlListDialog(self.list_store, name, f"Manage {list_name}", self)
+        if dialog.exec_() == QDialog.Accepted and dialog.urls_modified:
+            urls = self.list_store.urls(name)
+            if name == "whitelist":
+                self.whitelist = urls
+            else:
+                self.blacklist = urls
+            self.apply_filter(UrlFilter(self.whitelist, self.blacklist, NAV_DECISION_CACHE_SIZE, self.filter_stats))
+            log_event(f"{name.upper()}_MODIFIED", f"{list_name} updated. Count: {len(urls)}")
+            QMessageBox.information(self, f"{list_name} Updated", f"{list_name} has been updated.")
 
     def manage_whitelist(self):
-        dialog = UrlListDialog(list(self.whitelist), "Manage Whitelist", self)
-        if dialog.exec_() == QDialog.Accepted:
-            new_whitelist = dialog.get_urls()
-            if new_whitelist != self.whitelist:
-                self.whitelist = new_whitelist
-                self.save_list_to_file(WHITELIST_FILE, self.whitelist, "Whitelist")
-                self.custom_page.whitelist = self.whitelist
-                log_event("WHITELIST_MODIFIED", f"Whitelist updated. Count: {len(self.whitelist)}")
-                QMessageBox.information(self, "Whitelist Updated", "Whitelist has been updated.")
+        self.manage_list("whitelist", "Whitelist")
 
     def manage_blacklist(self):
-        dialog = UrlListDialog(list(self.blacklist), "Manage Blacklist", self)
-        if dialog.exec_() == QDialog.Accepted:
-            new_blacklist = dialog.get_urls()
-            if new_blacklist != self.blacklist:
-                self.blacklist = new_blacklist
-                self.save_list_to_file(BLACKLIST_FILE, self.blacklist, "Blacklist")
-                self.custom_page.blacklist = self.blacklist
-                log_event("BLACKLIST_MODIFIED", f"Blacklist updated. Count: {len(self.blacklist)}")
-                QMessageBox.information(self, "Blacklist Updated", "Blacklist has been updated.")
-
-    @pyqtSlot(str, str)
-    def show_blocked_message_slot(self, url, reason):
-        # Make QMessageBox also adhere to the dark theme (partially done by QSS)
-        msg_box = QMessageBox(self) # Parent to self
-        msg_box.setIcon(QMessageBox.Warning)
-        msg_box.setWindowTitle("Navigation Blocked")
-        msg_box.setText(f"Access to:\n{url}\n\nwas blocked.")
-        msg_box.setInformativeText(f"Reason: {reason}")
-        msg_box.setStandardButtons(QMessageBox.Ok)
-        msg_box.exec_()
+        self.manage_list("blacklist", "Blacklist")
 
+    def update_blocked_status(self):
+        """Summarise requests blocked since the last tick; a burst of them costs one status bar update."""
+        pending = self.blocked_counter.take_pending()
+        if not pending:
+            return
+        latest_url, latest_reason = self.blocked_counter.recent[-1]
+        self.blocked_label.setText(f"Blocked: {self.blocked_counter.total}")
+        self.blocked_label.setToolTip("Recently blocked:\n" + "\n".join(
+            f"{url} ({reason})" for url, reason in reversed(self.blocked_counter.recent)))
+        self.status.showMessage(f"Blocked {pending} request{'s' if pending != 1 else ''} - latest: "
+                                f"{latest_url} ({latest_reason})", BLOCKED_STATUS_INTERVAL_MS * 5)
 
     def closeEvent(self, event):
         log_event("APP_LIFECYCLE", "Application closing...")
+        self.log_suppressor.flush(everything=True)
+        activity_logger.flush()
+        if self._list_store is not None:
+            self._list_store.close()
         super().closeEvent(event)
 
 
@@ -478,21 +1262,24 @@ if __name__ == '__main__':
     if hasattr(Qt, 'AA_UseHighDpiPixmaps'):
         QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
 
+    startup_profile.mark("imports")
+    register_blocked_page_scheme()
     app = QApplication(sys.argv)
     app.setApplicationName(APP_NAME)
+    startup_profile.mark("qapplication")
 
     # Apply the global stylesheet
     app.setStyleSheet(STYLESHEET)
+    startup_profile.mark("stylesheet")
     
     # Set a default font (optional, but good for consistency)
     # default_font = QFont("Segoe UI", 10) # Example for Windows
     # app.setFont(default_font)
 
 
-    if os.path.exists(APP_ICON_PATH):
-        app.setWindowIcon(QIcon(APP_ICON_PATH))
-    else:
-        print(f"Warning: Main application icon not found at {APP_ICON_PATH}")
+    app_icon = find_icon(APP_ICON_PATH)
+    if app_icon is not None:
+        app.setWindowIcon(app_icon)
 
     log_event("SESSION_START", f"{APP_NAME} session started.")
 
@@ -500,4 +1287,5 @@ if __name__ == '__main__':
     exit_code = app.exec_()
     
     log_event("SESSION_END", f"{APP_NAME} session ended. Exit code: {exit_code}")
+    activity_logger.close()
     sys.exit(exit_code)  
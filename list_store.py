@@ -0,0 +1,140 @@
+"""SQLite storage for the browser's whitelist/blacklist.
+
+Each list is a set of lowercase entries keyed by (list, url), so membership tests,
+adds and removes are B-tree operations instead of rereading or rewriting a text
+file. Entries are edited incrementally, pages of a (filtered) list can be read
+without loading all of it, and standard hosts files and adblock filter lists can be
+bulk-imported. Kept free of Qt like url_filter.py.
+"""
+import os
+import sqlite3
+
+# Host names that hosts files map to themselves; never worth blocking
+_HOSTS_IGNORED = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost",
+                  "ip6-loopback", "0.0.0.0"}
+_HOSTS_ADDRESSES = {"0.0.0.0", "127.0.0.1", "::", "::1", "::0"}
+
+
+def parse_list_lines(lines):
+    """Yield entries from plain one-per-line lists, hosts files or adblock filter lists.
+
+    Adblock rules that can't be expressed as a plain substring (exceptions, cosmetic
+    filters, wildcards, regexes) are skipped; `||host^$options` keeps just the host.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in "#!" or line.startswith("[") or line.startswith("@@"):
+            continue
+        if "##" in line or "#@#" in line or "#?#" in line:
+            continue
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] in _HOSTS_ADDRESSES:
+            for host in fields[1:]:
+                if host.startswith("#"):
+                    break
+                if host.lower() not in _HOSTS_IGNORED:
+                    yield host.lower()
+            continue
+        if line.startswith("/") and line.endswith("/") and len(line) > 2:
+            continue  # Regex filter
+        entry = line.split("$", 1)[0]
+        if entry.startswith("||"):
+            entry = entry[2:]
+        entry = entry.strip("|").rstrip("^")
+        if not entry or "*" in entry or "^" in entry:
+            continue
+        yield entry.lower()
+
+
+class UrlListStore:
+    def __init__(self, path):
+        self.path = path
+        # Autocommit; edits made while a dialog is open are grouped with begin()/commit()/rollback()
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(list TEXT NOT NULL, url TEXT NOT NULL, PRIMARY KEY (list, url)) WITHOUT ROWID")
+        self._db.execute("CREATE TABLE IF NOT EXISTS migrated (list TEXT PRIMARY KEY)")
+
+    def close(self):
+        self._db.close()
+
+    def begin(self):
+        self._db.execute("BEGIN")
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def urls(self, name):
+        return [row[0] for row in self._db.execute("SELECT url FROM entries WHERE list = ? ORDER BY url", (name,))]
+
+    def contains(self, name, url):
+        return self._db.execute("SELECT 1 FROM entries WHERE list = ? AND url = ?",
+                                (name, url.lower())).fetchone() is not None
+
+    @staticmethod
+    def _filter_clause(filter_text):
+        if not filter_text:
+            return "", ()
+        pattern = filter_text.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return " AND url LIKE ? ESCAPE '\\'", (f"%{pattern}%",)
+
+    def count(self, name, filter_text=""):
+        clause, params = self._filter_clause(filter_text)
+        row = self._db.execute(f"SELECT COUNT(*) FROM entries WHERE list = ?{clause}", (name,) + params).fetchone()
+        return row[0]
+
+    def page(self, name, filter_text="", offset=0, limit=200):
+        clause, params = self._filter_clause(filter_text)
+        rows = self._db.execute(f"SELECT url FROM entries WHERE list = ?{clause} ORDER BY url LIMIT ? OFFSET ?",
+                                (name,) + params + (limit, offset))
+        return [row[0] for row in rows]
+
+    def _write_many(self, sql, rows):
+        """Run `sql` for every row in one transaction (the caller's, if one is open); returns rows changed."""
+        own_transaction = not self._db.in_transaction
+        if own_transaction:
+            self._db.execute("BEGIN")
+        before = self._db.total_changes
+        try:
+            self._db.executemany(sql, rows)
+        except Exception:
+            if own_transaction:
+                self._db.execute("ROLLBACK")
+            raise
+        if own_transaction:
+            self._db.execute("COMMIT")
+        return self._db.total_changes - before
+
+    def add(self, name, urls):
+        """Add entries, ignoring ones already present; returns how many were new."""
+        return self._write_many("INSERT OR IGNORE INTO entries (list, url) VALUES (?, ?)",
+                                ((name, url.strip().lower()) for url in urls if url.strip()))
+
+    def remove(self, name, urls):
+        return self._write_many("DELETE FROM entries WHERE list = ? AND url = ?",
+                                ((name, url.lower()) for url in urls))
+
+    def import_file(self, name, filename):
+        """Bulk-add a plain, hosts or adblock list file; returns how many entries were new."""
+        with open(filename, "r", encoding="utf-8", errors="replace") as f:
+            return self.add(name, parse_list_lines(f))
+
+    def migrate_text_file(self, name, filename):
+        """Import a legacy one-per-line list file the first time this list is opened.
+
+        Returns the number of entries imported, or None if there was nothing to migrate.
+        """
+        if self._db.execute("SELECT 1 FROM migrated WHERE list = ?", (name,)).fetchone():
+            return None
+        added = None
+        if os.path.exists(filename):
+            # Legacy files hold raw substrings, so lines are taken as they are rather than parsed
+            with open(filename, "r", encoding="utf-8") as f:
+                added = self.add(name, f)
+        self._db.execute("INSERT INTO migrated (list) VALUES (?)", (name,))
+        return added
@@ -0,0 +1,104 @@
+import os
+
+os.environ.setdefault("TOGETHER_API_KEY", "test")
+
+import pytest
+
+from app import CodeExtractor
+
+
+def extract(chunks, language=''):
+    """Feed the chunks through a fresh extractor; return (streamed deltas, result)."""
+    extractor = CodeExtractor(language)
+    deltas = [extractor.feed(chunk) for chunk in chunks]
+    deltas.append(extractor.finish())
+    return deltas, extractor.result()
+
+
+def every_split(text):
+    """Every way of cutting text into two chunks, plus one chunk per character."""
+    for cut in range(len(text) + 1):
+        yield [text[:cut], text[cut:]]
+    yield list(text)
+
+
+RESPONSE = "Here you go:\n```js\nconst a = `x`;\nconsole.log(a);\n```\nHope that helps."
+
+
+@pytest.mark.parametrize("chunks", list(every_split(RESPONSE)))
+def test_fence_split_across_chunks(chunks):
+    deltas, result = extract(chunks, 'js')
+    assert result == "const a = `x`;\nconsole.log(a);"
+    assert ''.join(deltas) == result
+
+
+@pytest.mark.parametrize("tag", ['js', 'javascript', 'jsx', 'JavaScript'])
+def test_language_aliases(tag):
+    text = f"```python\nprint(1)\n```\n```{tag}\nlet x = 1;\n```\n"
+    assert extract([text], 'javascript')[1] == "let x = 1;"
+    assert extract([text], 'js')[1] == "let x = 1;"
+
+
+def test_first_wanted_block_wins():
+    text = "```css\na {}\n```\n```html\n<p>1</p>\n```\n```html\n<p>2</p>\n```\n"
+    assert extract([text], 'html')[1] == "<p>1</p>"
+
+
+def test_untagged_falls_back_to_first_block():
+    text = "Intro\n```\nfirst\n```\nmore\n```python\nsecond\n```\n"
+    deltas, result = extract([text], 'js')
+    assert result == "first"
+    assert ''.join(deltas) == result
+
+
+def test_unterminated_fence():
+    deltas, result = extract(["```js\nlet x = 1;\n", "let y = 2;\n  "], 'js')
+    assert result == "let x = 1;\nlet y = 2;"
+    assert ''.join(deltas) == result
+
+
+def test_backticks_inside_a_line():
+    text = "```js\nconst s = ```not a fence```;\n  ``` also not\n```\n"
+    deltas, result = extract(list(text), 'js')
+    assert result == "const s = ```not a fence```;"
+    assert ''.join(deltas) == result
+
+
+def test_empty_chunks():
+    chunks = ["", "```js\n", "", "let x = 1;", "", "\n", "", "```", ""]
+    deltas, result = extract(chunks, 'js')
+    assert result == "let x = 1;"
+    assert ''.join(deltas) == result
+
+
+def test_indented_closing_fence():
+    deltas, result = extract(["```js\nf();\n", "   ``", "`\ntrailing prose"], 'js')
+    assert result == "f();"
+    assert ''.join(deltas) == result
+
+
+def test_prose_and_other_blocks_are_not_streamed():
+    chunks = ["Sure!\n", "```css\na {}\n```\n", "```js\n", "go();\n", "```\n", "Bye\n", "```js\nno();\n```\n"]
+    extractor = CodeExtractor('js')
+    deltas = [extractor.feed(chunk) for chunk in chunks]
+    assert deltas == ['', '', '', 'go();', '', '', '']
+    assert extractor.finish() == ''
+    assert extractor.result() == "go();"
+
+
+def test_text_without_fences_is_returned_whole():
+    text = "  just some code\nwithout fences\n"
+    deltas, result = extract([text[:7], text[7:]], 'js')
+    assert result == text
+    assert deltas[:-1] == ['', ''] and deltas[-1] == text
+
+
+def test_result_does_not_depend_on_chunking():
+    text = "Intro `x`\n\n```js  \n\n  a()\n\tb(`c`)  \n\n```\n```js\nz()\n```"
+    expected = extract([text], 'js')[1]
+    assert expected == "a()\n\tb(`c`)"
+    for size in range(1, 8):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        deltas, result = extract(chunks, 'js')
+        assert result == expected
+        assert ''.join(deltas) == expected
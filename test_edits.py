@@ -0,0 +1,89 @@
+import os
+
+os.environ.setdefault("TOGETHER_API_KEY", "test")
+
+import pytest
+
+import app
+from app import Generation, PatchError, apply_edits, parse_edits
+
+
+def edit(search, replace):
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE"
+
+
+def test_parse_edits_in_order():
+    text = "Here are the edits:\n" + edit("a = 1\n", "a = 2\n") + "\nand\n" + edit("b()\n", "") + "\nDone."
+    assert parse_edits(text) == [("a = 1\n", "a = 2\n"), ("b()\n", "")]
+
+
+def test_parse_edits_without_blocks():
+    with pytest.raises(PatchError, match="no SEARCH/REPLACE"):
+        parse_edits("```js\nconst a = 2;\n```")
+
+
+def test_apply_edits_in_sequence():
+    source = "let a = 1;\nlet b = 2;\n"
+    patched, applied = apply_edits(source, [("let a = 1;\n", "let a = 3;\n"), ("let a = 3;\nlet b", "let c")])
+    assert patched == "let c = 2;\n"
+    assert len(applied) == 2
+
+
+def test_search_matching_more_than_once():
+    with pytest.raises(PatchError, match="matches 2 places"):
+        apply_edits("x();\ny();\nx();\n", [("x();\n", "z();\n")])
+
+
+def test_search_not_found():
+    with pytest.raises(PatchError, match="not found"):
+        apply_edits("x();\n", [("y();\n", "z();\n")])
+
+
+def test_missing_trailing_newline_at_eof():
+    patched, applied = apply_edits("a();\nb();", [("b();\n", "c();\n")])
+    assert patched == "a();\nc();"
+    assert applied == [("b();", "c();")]
+
+
+def test_empty_search_against_empty_source():
+    assert apply_edits("", [("", "<p>new</p>\n")]) == ("<p>new</p>\n", [("", "<p>new</p>\n")])
+    with pytest.raises(PatchError, match="empty SEARCH"):
+        apply_edits("<p>old</p>\n", [("", "<p>new</p>\n")])
+
+
+class FinishedFlight:
+    def __init__(self, result):
+        self.result = result
+
+    def wait(self):
+        return self.result
+
+
+def test_fallback_to_full_mode(monkeypatch):
+    payload = {'language': 'js', 'jsCode': "let a = 1;\n", 'responseMode': 'edits'}
+    rerun = []
+
+    def begin_generation(data, track=True):
+        rerun.append(data)
+        return Generation('js', cached_code="let a = 2;", data=data)
+
+    monkeypatch.setattr(app, 'begin_generation', begin_generation)
+    generation = Generation('js', flight=FinishedFlight(edit("let b = 1;\n", "let b = 2;\n")), is_leader=True,
+                            mode='edits', source=payload['jsCode'], data=payload)
+    code = generation.wait()
+    assert code == "let a = 2;"
+    assert rerun == [dict(payload, responseMode='full')]
+    result = generation.to_json(code)
+    assert result['responseMode'] == 'full'
+    assert "not found" in result['patchError']
+
+
+def test_cached_edits_are_not_reported_as_coalesced():
+    payload = {'language': 'js', 'jsCode': "let a = 1;\n", 'prompt': 'Bump a', 'responseMode': 'edits'}
+    key = app.cache_key(*app.read_payload(payload), 'edits')
+    app.response_cache.set(key, edit("let a = 1;\n", "let a = 2;\n"))
+    response = app.app.test_client().post('/generate-code', json=payload)
+    assert response.status_code == 200
+    assert response.json['generatedCode'] == "let a = 2;\n"
+    assert response.headers['X-Cache'] == 'HIT'
+    assert 'X-Coalesced' not in response.headers
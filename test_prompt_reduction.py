@@ -0,0 +1,65 @@
+import os
+
+os.environ.setdefault("TOGETHER_API_KEY", "test")
+
+import pytest
+
+from app import PayloadError, fit_budget, reduce_sources, strip_comments, truncate_middle
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("const re = /\\/*foo/; // tail\nx();", "const re = /\\/*foo/; \nx();"),
+    ("if (a) return /[/*]+/g.test(b); /* block */", "if (a) return /[/*]+/g.test(b); "),
+    ("const r = x.replace(/\\/\\//g, ''); // gone", "const r = x.replace(/\\/\\//g, ''); "),
+    ("x = typeof /a*/; y = 1 // c", "x = typeof /a*/; y = 1 "),
+])
+def test_regex_literals_are_not_comments(code, expected):
+    assert strip_comments(code, 'js') == expected
+
+
+def test_division_is_not_a_regex_literal():
+    assert strip_comments("let d = a / b; /* c */ let e = f / g;", 'js') == "let d = a / b;  let e = f / g;"
+
+
+@pytest.mark.parametrize("code", [
+    "const s = '/* not a comment */';",
+    "const t = `// nope ${x}`;",
+    "const u = 'http://x.y/';",
+])
+def test_strings_keep_comment_markers(code):
+    assert strip_comments(code + " // c", 'js') == code + " "
+
+
+def test_html_strips_inline_script_and_style_comments():
+    html = "<!-- c --><p>x</p><script>let a = /\\/*/; // c\n</script><style>/* s */p{}</style>"
+    assert strip_comments(html, 'html') == "<p>x</p><script>let a = /\\/*/; \n</script><style>p{}</style>"
+
+
+def test_target_is_sent_exact():
+    js = "// keep me\nfunction f() {\n    return 1;\n}\n"
+    html_code, css_code, js_code, stats = reduce_sources('js', "<!-- drop --><p>x</p>", "", js, exact=('js',))
+    assert js_code == js
+    assert html_code == "<p>x</p>"
+
+
+def test_target_over_budget_is_refused():
+    sources = {'html': "<p>x</p>\n" * 10, 'css': "", 'js': "f();\n" * 1000}
+    with pytest.raises(PayloadError) as raised:
+        fit_budget(sources, 'js', 100)
+    assert raised.value.status == 413
+
+
+def test_other_sources_are_cut_with_their_own_comment_syntax():
+    sources = {'html': "<p>x</p>\n" * 200, 'css': "p { color: red; }\n" * 200, 'js': "f();\n"}
+    fitted, truncated = fit_budget(sources, 'js', 400)
+    assert fitted['js'] == sources['js']
+    assert sorted(truncated) == ['css', 'html']
+    assert "<!-- ..." in fitted['html'] and "/*" not in fitted['html']
+    assert "/* ..." in fitted['css']
+
+
+def test_truncate_middle_keeps_head_and_tail():
+    code = "".join(f"line {i}\n" for i in range(100))
+    cut = truncate_middle(code, 200, 'js')
+    assert cut.startswith("line 0\n") and cut.endswith("line 99\n")
+    assert "lines omitted" in cut and len(cut) < len(code)
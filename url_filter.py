@@ -0,0 +1,145 @@
+"""Compiled URL matching for the browser's whitelist/blacklist.
+
+The lists use substring semantics: an entry matches any URL that contains it
+(case-insensitively). Checking every entry with `in` costs O(entries x URL length)
+per navigation. UrlMatcher indexes each entry under one of its 4-character slices,
+the one shared with the fewest other entries, the way adblock engines index
+filters by token. A check then slides a 4-character window over the URL and only
+verifies the handful of entries filed under each slice, so it costs O(URL length)
+however long the list is. Kept free of Qt so it can be benchmarked and reused on
+its own (see benchmarks/bench_url_filter.py).
+
+UrlFilter puts the two lists and an LRU of recent decisions behind one object, so
+changing a list means swapping in a new UrlFilter: no caller can ever see a cached
+decision that was made against the old lists.
+"""
+from collections import OrderedDict
+
+GRAM = 4  # Slice length used as the index key; shorter entries are scanned directly
+
+# Below this many entries a plain scan (which runs in C) beats the index
+LINEAR_SCAN_LIMIT = 64
+
+
+class UrlMatcher:
+    """Matches URLs against a list of lowercase substring patterns."""
+
+    def __init__(self, patterns):
+        # Sorted, so the pattern reported for a URL doesn't depend on list order
+        self.patterns = sorted({pattern.lower() for pattern in patterns})
+        self.matches_everything = "" in self.patterns  # "" is a substring of every URL
+        self._index = {}  # slice -> [(pattern, offset of the slice in the pattern)]
+        self._short = []  # Patterns shorter than GRAM, checked with `in`
+        if len(self.patterns) > LINEAR_SCAN_LIMIT:
+            self._build()
+        else:
+            self._short = self.patterns
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _build(self):
+        index = self._index
+        for pattern in self.patterns:
+            if len(pattern) < GRAM:
+                if pattern:
+                    self._short.append(pattern)
+                continue
+            # File the pattern under its least crowded slice so buckets stay small
+            best_offset, best_size = 0, None
+            for offset in range(len(pattern) - GRAM + 1):
+                size = len(index.get(pattern[offset:offset + GRAM], ()))
+                if best_size is None or size < best_size:
+                    best_offset, best_size = offset, size
+                    if size == 0:
+                        break
+            index.setdefault(pattern[best_offset:best_offset + GRAM], []).append((pattern, best_offset))
+
+    def find(self, url):
+        """Return a pattern contained in `url` (lowercased), or None."""
+        if self.matches_everything:
+            return ""
+        url = url.lower()
+        for pattern in self._short:
+            if pattern in url:
+                return pattern
+        index = self._index
+        if index:
+            for position in range(len(url) - GRAM + 1):
+                bucket = index.get(url[position:position + GRAM])
+                if bucket:
+                    for pattern, offset in bucket:
+                        if position >= offset and url.startswith(pattern, position - offset):
+                            return pattern
+        return None
+
+    def matches(self, url):
+        return self.find(url) is not None
+
+
+class FilterStats:
+    """Decision cache counters; handed from one UrlFilter to the next so they span list changes."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class UrlFilter:
+    """Whitelist/blacklist decisions for URLs, with a bounded LRU of recent decisions.
+
+    decide() returns (allowed, reason, matched entry): the reason is "blacklisted",
+    "whitelisted", "not_whitelisted" or "default" (no whitelist and not blacklisted).
+    """
+
+    def __init__(self, whitelist, blacklist, cache_size=4096, stats=None):
+        self.whitelist = whitelist
+        self.blacklist = blacklist
+        self.whitelist_matcher = UrlMatcher(whitelist)
+        self.blacklist_matcher = UrlMatcher(blacklist)
+        self.cache_size = cache_size
+        self.stats = stats or FilterStats()
+        self._cache = OrderedDict()
+        # URLs differing only in their fragment share a decision, unless an entry could match one
+        self._strip_fragment = not any("#" in entry for entry in list(whitelist) + list(blacklist))
+
+    def cache_key(self, url):
+        url = url.lower()
+        return url.split("#", 1)[0] if self._strip_fragment else url
+
+    def decide(self, url):
+        key = self.cache_key(url)
+        decision = self._cache.get(key)
+        if decision is not None:
+            self._cache.move_to_end(key)
+            self.stats.hits += 1
+            return decision
+        self.stats.misses += 1
+        decision = self._evaluate(url)
+        if self.cache_size > 0:
+            self._cache[key] = decision
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return decision
+
+    def _evaluate(self, url):
+        matched = self.blacklist_matcher.find(url)
+        if matched is not None:
+            return False, "blacklisted", matched
+        if self.whitelist:
+            matched = self.whitelist_matcher.find(url)
+            if matched is not None:
+                return True, "whitelisted", matched
+            return False, "not_whitelisted", None
+        return True, "default", None
+
+    def __len__(self):
+        return len(self._cache)